@@ -0,0 +1,328 @@
+# api_usage.py
+# Counts the GitHub and Perchance requests of each contribution run, split by pipeline stage
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# (ApiUsage, stage name) of the run active in the current thread
+_current = contextvars.ContextVar('api_usage', default=None)
+_log_path = None
+_log_lock = threading.Lock()
+_installed = False
+_install_lock = threading.Lock()
+
+_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+# Path segments after which the rest of the path is a free-form name
+_NAME_SEGMENTS = {'contents': ':path', 'branches': ':branch', 'heads': ':branch', 'compare': ':range'}
+
+
+def endpoint_class(url):
+    """
+    Reduce a request URL to its service and endpoint template.
+
+    e.g. https://api.github.com/repos/o/r/git/trees/<sha> -> ('github', '/repos/:owner/:repo/git/trees/:sha')
+
+    :param url: Request URL
+    :return: Tuple of (service, endpoint)
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname or ''
+    if host == 'api.github.com' or host.endswith('.github.com'):
+        service = 'github'
+    elif host == 'perchance.org' or host.endswith('.perchance.org'):
+        service = 'perchance'
+    else:
+        service = host
+
+    parts = [part for part in parsed.path.split('/') if part]
+    if len(parts) >= 3 and parts[0] == 'repos':
+        parts[1:3] = [':owner', ':repo']
+    if service == 'perchance' and len(parts) >= 2 and parts[0] == 'file':
+        parts[1:] = [':id']
+
+    template = []
+    for part in parts:
+        if part.isdigit():
+            template.append(':number')
+        elif _SHA_PATTERN.match(part):
+            template.append(':sha')
+        else:
+            template.append(part)
+            if part in _NAME_SEGMENTS:
+                template.append(_NAME_SEGMENTS[part])
+                break
+    return service, '/' + '/'.join(template)
+
+
+class ApiUsage:
+    """
+    Request counters of one contribution run.
+
+    Requests are attributed to the innermost stage() active in the thread
+    that sends them; requests of other threads or outside any run are not
+    counted.
+    """
+
+    def __init__(self, issue_number):
+        """
+        :param issue_number: Number of the contribution issue
+        """
+        self.issue_number = issue_number
+        self.started_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()
+        # (stage, service, method, endpoint) -> counters
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Attribute the requests made inside the block to a stage.
+
+        :param name: Stage name, e.g. '_commit_files'
+        """
+        token = _current.set((self, name))
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def record(self, stage, method, url, status, bytes_sent, bytes_received, seconds):
+        service, endpoint = endpoint_class(url)
+        with self._lock:
+            counters = self.calls.setdefault((stage, service, method, endpoint), {
+                'calls': 0, 'errors': 0, 'not_modified': 0,
+                'bytes_sent': 0, 'bytes_received': 0, 'seconds': 0.0, 'max_seconds': 0.0
+            })
+            counters['calls'] += 1
+            if status is None or status >= 400:
+                counters['errors'] += 1
+            elif status == 304:
+                counters['not_modified'] += 1
+            counters['bytes_sent'] += bytes_sent
+            counters['bytes_received'] += bytes_received
+            counters['seconds'] += seconds
+            counters['max_seconds'] = max(counters['max_seconds'], seconds)
+
+    def summary(self, status):
+        """
+        Build the JSON summary of the run.
+
+        :param status: Outcome of the run, e.g. 'success' or 'failed'
+        :return: Dictionary with totals and per-stage endpoint counters
+        """
+        stages = {}
+        with self._lock:
+            for (stage, service, method, endpoint), counters in sorted(self.calls.items()):
+                stages.setdefault(stage, []).append({
+                    'service': service, 'method': method, 'endpoint': endpoint,
+                    **counters, 'seconds': round(counters['seconds'], 4), 'max_seconds': round(counters['max_seconds'], 4)
+                })
+        return {
+            'issue': self.issue_number,
+            'started_at': self.started_at,
+            'status': status,
+            'totals': _totals(endpoint for endpoints in stages.values() for endpoint in endpoints),
+            'stages': {stage: {'totals': _totals(endpoints), 'endpoints': endpoints} for stage, endpoints in stages.items()}
+        }
+
+    def finish(self, status):
+        """
+        Append the summary of the run to the configured log, if any.
+
+        :param status: Outcome of the run
+        :return: The summary dictionary
+        """
+        summary = self.summary(status)
+        if _log_path:
+            line = json.dumps(summary, separators=(',', ':')) + '\n'
+            with _log_lock, open(_log_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return summary
+
+
+def _totals(endpoints):
+    totals = {'calls': 0, 'errors': 0, 'not_modified': 0, 'bytes_sent': 0, 'bytes_received': 0, 'seconds': 0.0}
+    for endpoint in endpoints:
+        for key in totals:
+            totals[key] += endpoint[key]
+    totals['seconds'] = round(totals['seconds'], 4)
+    return totals
+
+
+def api_stage(name):
+    """
+    Decorator attributing the requests of a ContributionProcessor method to a stage.
+
+    :param name: Stage name
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.api_usage.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    # Streamed uploads, the size is unknown without consuming them
+    return 0
+
+
+def install():
+    """
+    Count every request sent through requests' HTTPAdapter, which both the
+    PyGithub client and the Perchance download session use.
+    """
+    global _installed
+    from requests.adapters import HTTPAdapter
+
+    with _install_lock:
+        if _installed:
+            return
+        send = HTTPAdapter.send
+
+        @functools.wraps(send)
+        def counted_send(adapter, request, **kwargs):
+            current = _current.get()
+            if current is None:
+                return send(adapter, request, **kwargs)
+
+            usage, stage = current
+            started = time.monotonic()
+            try:
+                response = send(adapter, request, **kwargs)
+            except Exception:
+                usage.record(stage, request.method, request.url, None, _body_size(request.body), 0, time.monotonic() - started)
+                raise
+            if kwargs.get('stream'):
+                # Reading the body here would defeat streaming, use the announced size
+                received = int(response.headers.get('Content-Length') or 0)
+            else:
+                received = len(response.content)
+            usage.record(stage, request.method, request.url, response.status_code, _body_size(request.body), received, time.monotonic() - started)
+            return response
+
+        HTTPAdapter.send = counted_send
+        _installed = True
+
+
+def configure(log_path):
+    """
+    Start counting requests and append one JSON summary per run to a file.
+
+    :param log_path: Path of the JSONL log
+    """
+    global _log_path
+    _log_path = log_path
+    install()
+
+
+def load_summaries(paths):
+    """
+    Read run summaries from JSONL logs.
+
+    :param paths: List of log paths
+    :return: List of summary dictionaries
+    """
+    summaries = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            summaries.extend(json.loads(line) for line in f if line.strip())
+    return summaries
+
+
+def aggregate(summaries, by='stage'):
+    """
+    Sum run summaries per stage or per endpoint.
+
+    Runs skipped as unchanged only read the ledger and are left out, so
+    they do not dilute the per-run averages.
+
+    :param summaries: Summaries from load_summaries()
+    :param by: 'stage' or 'endpoint'
+    :return: Tuple of (number of runs, {group: totals})
+    """
+    runs = [summary for summary in summaries if summary['status'] != 'unchanged']
+    groups = {}
+    for summary in runs:
+        for stage, stage_summary in summary['stages'].items():
+            for endpoint in stage_summary['endpoints']:
+                key = stage if by == 'stage' else f"{endpoint['method']} {endpoint['service']}{endpoint['endpoint']}"
+                totals = groups.setdefault(key, _totals([]))
+                for name in totals:
+                    totals[name] += endpoint[name]
+    return len(runs), groups
+
+
+def print_aggregate(summaries, by):
+    runs, groups = aggregate(summaries, by)
+    print(f"{runs} runs")
+    if not runs:
+        return
+    print(f"{by:<60} {'calls/run':>10} {'errors':>7} {'304':>6} {'sent/run':>10} {'recv/run':>10} {'ms/call':>8}")
+    for key, totals in sorted(groups.items(), key=lambda item: -item[1]['calls']):
+        print(f"{key:<60} {totals['calls'] / runs:>10.2f} {totals['errors']:>7} {totals['not_modified']:>6} "
+              f"{totals['bytes_sent'] / runs:>10.0f} {totals['bytes_received'] / runs:>10.0f} "
+              f"{1000 * totals['seconds'] / totals['calls']:>8.1f}")
+
+
+def compare(base, new, tolerance=0.0):
+    """
+    Compare the calls per run of each stage between two sets of summaries.
+
+    :param base: Summaries of the baseline
+    :param new: Summaries of the changed pipeline
+    :param tolerance: Increase of calls per run allowed before a stage counts as regressed
+    :return: List of (stage, base calls/run, new calls/run, regressed)
+    """
+    base_runs, base_groups = aggregate(base)
+    new_runs, new_groups = aggregate(new)
+    rows = []
+    for stage in sorted(set(base_groups) | set(new_groups)):
+        before = base_groups[stage]['calls'] / base_runs if stage in base_groups else 0.0
+        after = new_groups[stage]['calls'] / new_runs if stage in new_groups else 0.0
+        rows.append((stage, before, after, after > before + tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize API usage logs of the contribution processor')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summarize_parser = subparsers.add_parser('summarize', help='Totals per stage or endpoint')
+    summarize_parser.add_argument('logs', nargs='+', help='JSONL logs written with --api-usage')
+    summarize_parser.add_argument('--by', choices=('stage', 'endpoint'), default='stage')
+
+    compare_parser = subparsers.add_parser('compare', help='Exit with 1 if a stage makes more calls per run')
+    compare_parser.add_argument('base', help='Log of the baseline')
+    compare_parser.add_argument('new', help='Log of the changed pipeline')
+    compare_parser.add_argument('--tolerance', type=float, default=0.0, help='Allowed increase in calls per run')
+
+    args = parser.parse_args()
+    if args.command == 'summarize':
+        print_aggregate(load_summaries(args.logs), args.by)
+        return 0
+
+    rows = compare(load_summaries([args.base]), load_summaries([args.new]), args.tolerance)
+    for stage, before, after, regressed in rows:
+        print(f"{stage:<40} {before:>8.2f} -> {after:>8.2f}{'  REGRESSED' if regressed else ''}")
+    return 1 if any(regressed for *_, regressed in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# bench_issue_form.py
+# Throughput of the issue-form parser on large contribution bodies
+# Usage: python .github/scripts/benchmarks/bench_issue_form.py [--repeat N]
+import os
+import sys
+import time
+import argparse
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from issue_form import CONTRIBUTION_TEMPLATE, get_form_parser
+
+# CONTRIBUTION_TEMPLATE is relative to the repository root, resolve it so the benchmark runs from anywhere
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(SCRIPTS_DIR)), CONTRIBUTION_TEMPLATE)
+
+
+def make_body(lorebook_chars, readme_chars):
+    """
+    Build a contribution issue body shaped like the ones GitHub renders.
+
+    :param lorebook_chars: Approximate size of the lorebook answer
+    :param readme_chars: Approximate size of the README answer
+    :return: Issue body string
+    """
+    sentence = "The slime splits into two copies whenever it is startled. "
+    lorebook = "\n\n".join(sentence * 4 for _ in range(lorebook_chars // (len(sentence) * 4) + 1))[:lorebook_chars]
+    readme = ("## Usage\n\nSome *markdown* with a <b>tag</b>.\n\n### Tips\n\n" * (readme_chars // 60 + 1))[:readme_chars]
+
+    sections = [
+        ("Content Name", "Chloe"),
+        ("Short Description", "A friendly slime that can create copies of itself"),
+        ("Author Name", "username"),
+        ("Content Type", "Lorebook"),
+        ("Image URL for your content", "_No response_"),
+        ("Perchance Character Share Link", "_No response_"),
+        ("Custom Code", "_No response_"),
+        ("Lorebook Content", f"```plain\n{lorebook}\n```"),
+        ("README Content", readme),
+        ("Content Rating (REQUIRED)", "NSFW"),
+        ("Species", "Slime, Human"),
+        ("Genre", "Fantasy, Comedy"),
+        ("Legal Confirmations", "- [X] I confirm\n- [X] I agree\n- [X] I understand"),
+    ]
+    return "\n\n".join(f"### {label}\n\n{value}" for label, value in sections)
+
+
+def bench(parser, body, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser.parse(body)
+    elapsed = time.perf_counter() - start
+    return elapsed / repeat
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the issue-form parser")
+    arg_parser.add_argument("--repeat", type=int, default=200, help="Parses per body size")
+    args = arg_parser.parse_args()
+
+    parser = get_form_parser(TEMPLATE_PATH, key='label')
+
+    print(f"{'body size':>12} {'per parse':>12} {'throughput':>14}")
+    for lorebook_chars in (1_000, 65_536, 1_000_000):
+        body = make_body(lorebook_chars, min(lorebook_chars, 20_000))
+        per_parse = bench(parser, body, args.repeat)
+        print(f"{len(body):>12,} {per_parse * 1e6:>10.1f}us {len(body) / per_parse / 1e6:>10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
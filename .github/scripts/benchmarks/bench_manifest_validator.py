@@ -0,0 +1,116 @@
+# bench_manifest_validator.py
+# Compiled manifest validator against jsonschema, checking both report the same errors
+# Usage: python .github/scripts/benchmarks/bench_manifest_validator.py [--manifests N]
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsonschema
+
+from manifest_schema import MANIFEST_SCHEMA, load_validator
+
+
+def make_manifest(index):
+    """
+    Build a manifest shaped like the ones the contribution processor writes.
+
+    :param index: Number used to vary names and paths
+    :return: Manifest dictionary
+    """
+    char_path = f"ai-character-chat/characters/nsfw/Character {index}"
+    return {
+        "name": f"Character {index}",
+        "description": "A friendly slime that can create copies of itself",
+        "author": "username",
+        "authorId": 1000 + index,
+        "imageUrl": "https://example.com/image.png",
+        "shareUrl": f"https://perchance.org/ai-character-chat?data=Character~{index:016x}.gz",
+        "downloadPath": f"{char_path}/character.gz",
+        "shapeShifter_Pulls": index % 7,
+        "galleryChat_Clicks": index % 11,
+        "galleryDownload_Clicks": index % 13,
+        "groupSettings": {"requires": [], "recommends": [{"name": "Lorebook", "reason": "Lore"}]},
+        "features": {"customCode": [f"{char_path}/src/customCode.txt"], "assets": []},
+        "categories": {
+            "rating": "nsfw",
+            "species": ["Slime", "Human"],
+            "genre": ["Fantasy", "Comedy"],
+            "personality": ["Friendly"]
+        }
+    }
+
+
+# Mutations producing every kind of error the schema can report
+MUTATIONS = [
+    lambda m: m.pop("author"),
+    lambda m: m.update(name=None),
+    lambda m: m.update(authorId=True),
+    lambda m: m.update(shapeShifter_Pulls=-1, galleryChat_Clicks=1.5),
+    lambda m: m["groupSettings"]["requires"].append({"rating": 3}),
+    lambda m: m["features"].update(customCode=[1], assets="x"),
+    lambda m: m["categories"].update(rating=5, species=[1, "Slime"], genre=3),
+    lambda m: m.update(categories=[]),
+]
+
+
+def make_manifests(count, invalid_ratio, seed=0):
+    rng = random.Random(seed)
+    manifests = []
+    for index in range(count):
+        manifest = make_manifest(index)
+        if rng.random() < invalid_ratio:
+            # Keep the list order, later mutations replace what earlier ones edit
+            for position in sorted(rng.sample(range(len(MUTATIONS)), rng.randint(1, 3))):
+                MUTATIONS[position](manifest)
+        manifests.append(manifest)
+    return manifests
+
+
+def collect(iter_errors, manifests):
+    # jsonschema walks additionalProperties in set order, which depends on string
+    # hashing, so compare the errors sorted by path like the contribution validator
+    return [
+        sorted(((error.message, list(error.path)) for error in iter_errors(manifest)),
+               key=lambda error: ([str(part) for part in error[1]], error[0]))
+        for manifest in manifests
+    ]
+
+
+def bench(iter_errors, manifests, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for manifest in manifests:
+            for _error in iter_errors(manifest):
+                pass
+    return (time.perf_counter() - start) / (repeat * len(manifests))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the compiled manifest validator")
+    arg_parser.add_argument("--manifests", type=int, default=2000, help="Manifests per run")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Runs per validator")
+    args = arg_parser.parse_args()
+
+    compiled = load_validator(MANIFEST_SCHEMA)
+    reference = jsonschema.Draft7Validator(MANIFEST_SCHEMA).iter_errors
+
+    print(f"{'invalid':>8} {'jsonschema':>12} {'compiled':>12} {'speedup':>8}")
+    for invalid_ratio in (0.0, 0.1, 1.0):
+        manifests = make_manifests(args.manifests, invalid_ratio)
+        expected = collect(reference, copy.deepcopy(manifests))
+        actual = collect(compiled, manifests)
+        assert actual == expected, "compiled validator reports different errors than jsonschema"
+
+        reference_time = bench(reference, manifests, args.repeat)
+        compiled_time = bench(compiled, manifests, args.repeat)
+        print(f"{invalid_ratio:>8.0%} {reference_time * 1e6:>10.1f}us {compiled_time * 1e6:>10.1f}us "
+              f"{reference_time / compiled_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+# catalog.py
+# Local SQLite catalog of every character manifest, maintained incrementally, with a query CLI
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+
+from character_index import CHARACTERS_DIR, load_fragments
+from category_registry import get_registry
+from tag_index import character_tags
+
+DEFAULT_CATALOG_PATH = ".catalog.sqlite"
+# Bump when the tables or the stored values change, the catalog is then rebuilt from scratch
+CATALOG_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS characters (
+    path TEXT PRIMARY KEY,
+    manifest_hash TEXT NOT NULL,
+    files_signature TEXT NOT NULL,
+    name TEXT NOT NULL,
+    author TEXT NOT NULL,
+    author_id TEXT,
+    rating TEXT NOT NULL,
+    description TEXT,
+    image_url TEXT,
+    pulls INTEGER NOT NULL DEFAULT 0,
+    chat_clicks INTEGER NOT NULL DEFAULT 0,
+    download_clicks INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0,
+    manifest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS characters_author ON characters (author COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS characters_rating_bytes ON characters (rating, total_bytes);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT NOT NULL REFERENCES characters (path) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (path, category, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_category_tag ON tags (category, tag COLLATE NOCASE, path);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL REFERENCES characters (path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    PRIMARY KEY (path, name)
+) WITHOUT ROWID;
+"""
+
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$', re.IGNORECASE)
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def manifest_hash(manifest):
+    """
+    Hash a manifest independently of its key order and formatting.
+
+    :param manifest: Manifest dictionary
+    :return: Hex SHA-256
+    """
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def manifest_rating(categories):
+    """
+    Get the rating of a manifest, stored as a one-tag list or a plain string.
+
+    :param categories: Manifest categories
+    :return: Lowercase rating, '' if there is none
+    """
+    rating = categories.get('rating', '')
+    if isinstance(rating, list):
+        rating = rating[0] if rating else ''
+    return str(rating).strip().lower()
+
+
+def character_files(root, relative_path):
+    """
+    List the files of a character directory with their sizes.
+
+    :param root: Repository root
+    :param relative_path: Index key of the character, e.g. "sfw/Name by Author"
+    :return: Tuple of (list of (file name, bytes), signature of names, sizes and mtimes)
+    """
+    character_dir = os.path.join(root, CHARACTERS_DIR, relative_path)
+    files = []
+    signature = hashlib.sha256()
+
+    for dirpath, dirnames, filenames in os.walk(character_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            stat = os.stat(file_path)
+            name = os.path.relpath(file_path, character_dir).replace(os.sep, '/')
+            files.append((name, stat.st_size))
+            signature.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+
+    return files, signature.hexdigest()
+
+
+def parse_size(text):
+    """
+    Parse a human size such as "1MB", "512k" or "2048".
+
+    :param text: Size string
+    :return: Number of bytes
+    """
+    match = SIZE_PATTERN.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def connect(catalog_path=DEFAULT_CATALOG_PATH):
+    """
+    Open the catalog, creating or rebuilding its tables when needed.
+
+    :param catalog_path: Path of the SQLite file
+    :return: sqlite3.Connection
+    """
+    connection = sqlite3.connect(catalog_path)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA foreign_keys = ON")
+
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version != CATALOG_VERSION:
+        with connection:
+            for table in ("files", "tags", "characters", "meta"):
+                connection.execute(f"DROP TABLE IF EXISTS {table}")
+            connection.executescript(SCHEMA)
+            connection.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+
+    return connection
+
+
+def ingest(connection, root=".", registry=None):
+    """
+    Bring the catalog up to date with the index fragments of the working tree.
+
+    Characters whose manifest hash and file signature are unchanged are
+    skipped, removed characters are deleted. Tags are re-derived for every
+    character when categories.json changed.
+
+    :param connection: Connection from connect()
+    :param root: Repository root
+    :param registry: CategoryRegistry, defaults to the one of categories.json
+    :return: Dictionary with added, updated, removed and unchanged counts
+    """
+    registry = registry or get_registry(os.path.join(root, 'categories.json'))
+    known = {
+        row['path']: (row['manifest_hash'], row['files_signature'])
+        for row in connection.execute("SELECT path, manifest_hash, files_signature FROM characters")
+    }
+    row = connection.execute("SELECT value FROM meta WHERE key = 'categories_hash'").fetchone()
+    categories_changed = row is None or row['value'] != registry.content_hash
+
+    stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    seen = set()
+
+    with connection:
+        for entry in load_fragments(root):
+            path = entry['path']
+            manifest = entry['manifest']
+            seen.add(path)
+
+            digest = manifest_hash(manifest)
+            files, signature = character_files(root, path)
+            if known.get(path) == (digest, signature) and not categories_changed:
+                stats['unchanged'] += 1
+                continue
+
+            stats['updated' if path in known else 'added'] += 1
+            categories = manifest.get('categories', {})
+            connection.execute(
+                "INSERT OR REPLACE INTO characters (path, manifest_hash, files_signature, name, author, author_id, rating,"
+                " description, image_url, pulls, chat_clicks, download_clicks, total_bytes, manifest)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path, digest, signature,
+                    manifest.get('name', ''),
+                    manifest.get('author', ''),
+                    None if manifest.get('authorId') is None else str(manifest['authorId']),
+                    manifest_rating(categories),
+                    manifest.get('description'),
+                    manifest.get('imageUrl') or manifest.get('characterAvatar'),
+                    manifest.get('shapeShifter_Pulls', 0),
+                    manifest.get('galleryChat_Clicks', 0),
+                    manifest.get('galleryDownload_Clicks', 0),
+                    sum(size for _, size in files),
+                    json.dumps(manifest, sort_keys=True)
+                )
+            )
+            # INSERT OR REPLACE deletes the old row, which cascades to its tags and files
+            connection.executemany(
+                "INSERT OR IGNORE INTO tags (path, category, tag) VALUES (?, ?, ?)",
+                [(path, name, tag) for name, tag in character_tags(categories, registry)]
+            )
+            connection.executemany(
+                "INSERT INTO files (path, name, bytes) VALUES (?, ?, ?)",
+                [(path, name, size) for name, size in files]
+            )
+
+        for path in set(known) - seen:
+            connection.execute("DELETE FROM characters WHERE path = ?", (path,))
+            stats['removed'] += 1
+
+        connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('categories_hash', ?)",
+            (registry.content_hash,)
+        )
+
+    return stats
+
+
+def query(connection, rating=None, tags=(), any_tags=(), author=None, name=None,
+          min_bytes=None, max_bytes=None, order_by='path', limit=None):
+    """
+    Find characters matching every given filter.
+
+    :param connection: Connection from connect()
+    :param rating: 'sfw' or 'nsfw'
+    :param tags: Iterable of (category, tag) that must all be present
+    :param any_tags: Iterable of (category, tag) of which at least one must be present
+    :param author: Author name, case-insensitive
+    :param name: Substring of the character name, case-insensitive
+    :param min_bytes: Minimum total size of the character files
+    :param max_bytes: Maximum total size of the character files
+    :param order_by: Column to sort by, see ORDER_COLUMNS
+    :param limit: Maximum number of rows
+    :return: List of sqlite3.Row
+    """
+    clauses = []
+    params = []
+
+    if rating:
+        clauses.append("c.rating = ?")
+        params.append(rating.lower())
+    if author:
+        clauses.append("c.author = ? COLLATE NOCASE")
+        params.append(author)
+    if name:
+        clauses.append("c.name LIKE ?")
+        params.append(f"%{name}%")
+    if min_bytes is not None:
+        clauses.append("c.total_bytes >= ?")
+        params.append(min_bytes)
+    if max_bytes is not None:
+        clauses.append("c.total_bytes <= ?")
+        params.append(max_bytes)
+    for category, tag in tags:
+        clauses.append("EXISTS (SELECT 1 FROM tags t WHERE t.path = c.path AND t.category = ? AND t.tag = ? COLLATE NOCASE)")
+        params.extend([category.lower(), tag])
+    if any_tags:
+        alternatives = " OR ".join("(t.category = ? AND t.tag = ? COLLATE NOCASE)" for _ in any_tags)
+        clauses.append(f"EXISTS (SELECT 1 FROM tags t WHERE t.path = c.path AND ({alternatives}))")
+        for category, tag in any_tags:
+            params.extend([category.lower(), tag])
+
+    sql = ("SELECT c.path, c.name, c.author, c.rating, c.total_bytes, c.pulls, c.chat_clicks, c.download_clicks"
+           " FROM characters c")
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {ORDER_COLUMNS[order_by]}"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    return connection.execute(sql, params).fetchall()
+
+
+ORDER_COLUMNS = {
+    'path': 'c.path',
+    'name': 'c.name COLLATE NOCASE, c.path',
+    'size': 'c.total_bytes DESC, c.path',
+    'pulls': 'c.pulls DESC, c.path',
+    'chats': 'c.chat_clicks DESC, c.path',
+    'downloads': 'c.download_clicks DESC, c.path',
+}
+
+
+def _tag_argument(text):
+    category, separator, tag = text.partition('=')
+    if not separator or not category.strip() or not tag.strip():
+        raise argparse.ArgumentTypeError(f"Expected CATEGORY=TAG, got: {text}")
+    return category.strip(), tag.strip()
+
+
+def print_rows(rows, as_json=False):
+    """
+    Print query results as a table or as JSON lines.
+
+    :param rows: List of sqlite3.Row
+    :param as_json: Print one JSON object per row
+    """
+    if as_json:
+        for row in rows:
+            print(json.dumps(dict(row), ensure_ascii=False))
+        return
+
+    if not rows:
+        print("No results")
+        return
+
+    columns = rows[0].keys()
+    widths = [max(len(str(column)), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+    print(f"({len(rows)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a local SQLite catalog of all character manifests")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="Path of the SQLite catalog")
+    parser.add_argument("--root", default=".", help="Repository root")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("ingest", help="Bring the catalog up to date, re-ingesting only changed manifests")
+
+    query_parser = subparsers.add_parser("query", help="Find characters, e.g. query --rating nsfw --tag species=Dragon --author X --min-size 1MB")
+    query_parser.add_argument("--rating", choices=["sfw", "nsfw"], help="Content rating")
+    query_parser.add_argument("--tag", dest="tags", action="append", type=_tag_argument, default=[], help="CATEGORY=TAG that must be present, repeatable")
+    query_parser.add_argument("--any-tag", dest="any_tags", action="append", type=_tag_argument, default=[], help="CATEGORY=TAG of which one must be present, repeatable")
+    query_parser.add_argument("--author", help="Author name, case-insensitive")
+    query_parser.add_argument("--name", help="Part of the character name")
+    query_parser.add_argument("--min-size", type=parse_size, help="Minimum size of the character files, e.g. 1MB")
+    query_parser.add_argument("--max-size", type=parse_size, help="Maximum size of the character files")
+    query_parser.add_argument("--order-by", choices=sorted(ORDER_COLUMNS), default="path", help="Sort order")
+    query_parser.add_argument("--limit", type=int, help="Maximum number of results")
+    query_parser.add_argument("--json", action="store_true", help="Print one JSON object per result")
+    query_parser.add_argument("--no-ingest", action="store_true", help="Query the catalog as is, without updating it first")
+
+    sql_parser = subparsers.add_parser("sql", help="Run a read-only SQL statement against the catalog")
+    sql_parser.add_argument("statement", help="SQL statement")
+    sql_parser.add_argument("--json", action="store_true", help="Print one JSON object per result")
+
+    args = parser.parse_args()
+    connection = connect(args.catalog)
+
+    if args.command == "ingest" or (args.command == "query" and not args.no_ingest):
+        stats = ingest(connection, args.root)
+        print(f"Catalog: {stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+              f"{stats['unchanged']} unchanged", file=sys.stderr)
+
+    if args.command == "query":
+        rows = query(connection, args.rating, args.tags, args.any_tags, args.author, args.name,
+                     args.min_size, args.max_size, args.order_by, args.limit)
+        print_rows(rows, args.json)
+    elif args.command == "sql":
+        connection.execute("PRAGMA query_only = ON")
+        try:
+            rows = connection.execute(args.statement).fetchall()
+        except sqlite3.Error as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+        print_rows(rows, args.json)
+
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
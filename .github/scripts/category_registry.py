@@ -0,0 +1,144 @@
+# category_registry.py
+# Loads categories.json once and precomputes tag lookups shared by all scripts
+import os
+import json
+import hashlib
+import threading
+
+CATEGORIES_PATH = 'categories.json'
+RATINGS = ('sfw', 'nsfw')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class CategoryRegistry:
+    """
+    Precomputed view of categories.json.
+
+    Category names are looked up case-insensitively (by their lowercase
+    name). Tags valid for a rating are kept as frozensets and every tag has
+    a lowercase -> canonical spelling map, so tag checks are O(1).
+    """
+
+    def __init__(self, categories, content_hash=None):
+        """
+        :param categories: Parsed content of categories.json
+        :param content_hash: SHA-256 of the file the categories were loaded from
+        """
+        self.categories = categories
+        self.content_hash = content_hash
+        self.names = tuple(category['name'].lower() for category in categories)
+
+        self._by_name = {}
+        self._valid_tags = {}
+        self._canonical = {}
+        self._hashes = {}
+
+        for category in categories:
+            name = category['name'].lower()
+            general = category['tags'].get('general', [])
+            nsfw = category['tags'].get('nsfw', [])
+
+            self._by_name[name] = category
+            # nsfw_only categories have no valid tags for SFW content
+            self._valid_tags[(name, 'sfw')] = frozenset() if category.get('nsfw_only', False) else frozenset(general)
+            self._valid_tags[(name, 'nsfw')] = frozenset(general) | frozenset(nsfw)
+
+            for rating in RATINGS:
+                self._canonical[(name, rating)] = {tag.lower(): tag for tag in self._valid_tags[(name, rating)]}
+
+            self._hashes[name] = hashlib.sha256(json.dumps(category, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def category(self, name):
+        """
+        Get a category definition.
+
+        :param name: Category name, any case
+        :return: Category dictionary or None
+        """
+        return self._by_name.get(name.lower())
+
+    def valid_tags(self, name, rating='nsfw'):
+        """
+        Get the tags of a category that are valid for a rating.
+
+        :param name: Category name, any case
+        :param rating: 'sfw' or 'nsfw', any case
+        :return: frozenset of canonical tags (empty for unknown categories)
+        """
+        return self._valid_tags.get((name.lower(), self._rating_key(rating)), frozenset())
+
+    def canonical_tag(self, name, tag, rating='nsfw'):
+        """
+        Get the canonical spelling of a tag, matched case-insensitively.
+
+        :param name: Category name, any case
+        :param tag: Submitted tag
+        :param rating: 'sfw' or 'nsfw', any case
+        :return: Canonical tag, or None if the tag is not valid
+        """
+        canonical = self._canonical.get((name.lower(), self._rating_key(rating)))
+        if canonical is None:
+            return None
+        return canonical.get(str(tag).strip().lower())
+
+    def is_valid(self, name, tag, rating='nsfw'):
+        """
+        Check whether a tag is valid for a category and rating.
+
+        :param name: Category name, any case
+        :param tag: Submitted tag
+        :param rating: 'sfw' or 'nsfw', any case
+        :return: Boolean
+        """
+        return self.canonical_tag(name, tag, rating) is not None
+
+    def category_hash(self, name):
+        """
+        Get a hash of one category definition, to detect changes to it.
+
+        :param name: Category name, any case
+        :return: Hex SHA-256, or None for unknown categories
+        """
+        return self._hashes.get(name.lower())
+
+    @staticmethod
+    def _rating_key(rating):
+        # Manifests store the rating as a one-tag list. Only an explicit NSFW
+        # rating unlocks the NSFW tags, unknown or missing ones get the SFW set
+        if isinstance(rating, list):
+            rating = rating[0] if rating else ''
+        return 'nsfw' if str(rating).strip().lower() == 'nsfw' else 'sfw'
+
+
+def get_registry(path=CATEGORIES_PATH):
+    """
+    Get the registry for a categories file, loading it only when it changed.
+
+    The file is re-read when its mtime or size changes, and the registry is
+    only rebuilt if the content hash differs as well.
+
+    :param path: Path to categories.json
+    :return: CategoryRegistry
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        with open(key, 'rb') as f:
+            raw = f.read()
+        content_hash = hashlib.sha256(raw).hexdigest()
+
+        if cached and cached[1].content_hash == content_hash:
+            registry = cached[1]
+        else:
+            registry = CategoryRegistry(json.loads(raw), content_hash)
+
+        _cache[key] = (signature, registry)
+        return registry
@@ -0,0 +1,332 @@
+# character_index.py
+# Per-character index fragments and the deterministic merge that builds index.json from them
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+
+from github_client import make_github, retry_pause
+
+CHARACTERS_DIR = "ai-character-chat/characters"
+INDEX_PATH = f"{CHARACTERS_DIR}/index.json"
+FRAGMENTS_DIR = f"{CHARACTERS_DIR}/index.d"
+# "<rating>/<name>" with the characters sanitize_filename() leaves out, so paths cannot leave the characters directory
+_NAME_COMPONENT = r'(?!\.\.?(?:/|$))[^<>:"/\\|?*\x00-\x1f]+'
+CHARACTER_PATH_PATTERN = re.compile(f'^{_NAME_COMPONENT}/{_NAME_COMPONENT}$')
+
+# Marks a field missing from one side of a merge
+_MISSING = object()
+
+log = logging.getLogger(__name__)
+
+
+def relative_character_path(character_path):
+    """
+    Strip the characters directory prefix to get the path used as index key.
+
+    :param character_path: Repository path of the character directory
+    :return: Path relative to the characters directory, e.g. "sfw/Name by Author"
+    """
+    prefix = CHARACTERS_DIR + "/"
+    if character_path.startswith(prefix):
+        return character_path[len(prefix):]
+    return character_path
+
+
+def is_character_path(relative_path):
+    """
+    Check that a path from outside input has the shape of an index key.
+
+    :param relative_path: Candidate index key, e.g. "nsfw/Chloe 1"
+    :return: True if it names a character directory directly below a rating directory
+    """
+    return isinstance(relative_path, str) and CHARACTER_PATH_PATTERN.match(relative_path) is not None
+
+
+def fragment_path(relative_path):
+    """
+    Get the repository path of the fragment holding one index entry.
+
+    Fragments are sharded by rating, which is the first component of the path.
+
+    :param relative_path: Index key of the character, e.g. "nsfw/Chloe 1"
+    :return: Repository path of the fragment file
+    """
+    return f"{FRAGMENTS_DIR}/{relative_path}.json"
+
+
+def make_entry(relative_path, manifest):
+    """
+    Build an index entry.
+
+    :param relative_path: Index key of the character
+    :param manifest: Character manifest data
+    :return: Entry dictionary
+    """
+    return {
+        "path": relative_path,
+        "manifest": manifest
+    }
+
+
+def render_fragment(entry):
+    """
+    Serialize one entry as fragment file content.
+
+    :param entry: Entry dictionary with path and manifest
+    :return: JSON string
+    """
+    return json.dumps(entry, indent=2) + "\n"
+
+
+def render_index(entries):
+    """
+    Serialize entries as index.json content, sorted by path so the output is deterministic.
+
+    :param entries: Iterable of entry dictionaries
+    :return: JSON string
+    """
+    ordered = sorted(entries, key=lambda entry: entry["path"])
+    return json.dumps(ordered, indent=2) + "\n"
+
+
+def load_fragments(root="."):
+    """
+    Load every fragment from the working tree.
+
+    :param root: Repository root
+    :return: List of entries, in no particular order
+    """
+    fragments_root = os.path.join(root, FRAGMENTS_DIR)
+    entries = {}
+
+    for dirpath, dirnames, filenames in os.walk(fragments_root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(".json"):
+                continue
+
+            file_path = os.path.join(dirpath, filename)
+            with open(file_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+
+            if entry["path"] in entries:
+                raise ValueError(f"Duplicate index entry {entry['path']} in {file_path}")
+            entries[entry["path"]] = entry
+
+    return list(entries.values())
+
+
+def build_index(root="."):
+    """
+    Merge all fragments and write the combined index.json.
+
+    :param root: Repository root
+    :return: True if index.json changed
+    """
+    content = render_index(load_fragments(root))
+    index_file = os.path.join(root, INDEX_PATH)
+
+    if os.path.exists(index_file):
+        with open(index_file, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                print("index.json is up to date")
+                return False
+
+    with open(index_file, "w", encoding="utf-8") as f:
+        f.write(content)
+    print(f"Wrote {INDEX_PATH}")
+    return True
+
+
+def split_index(root="."):
+    """
+    Write one fragment per entry of the existing index.json (migration helper).
+
+    :param root: Repository root
+    :return: Number of fragments written
+    """
+    with open(os.path.join(root, INDEX_PATH), "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    for entry in entries:
+        file_path = os.path.join(root, fragment_path(entry["path"]))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(render_fragment(make_entry(entry["path"], entry["manifest"])))
+
+    print(f"Wrote {len(entries)} fragments to {FRAGMENTS_DIR}")
+    return len(entries)
+
+
+def _merge_fields(base, ours, theirs, prefix=""):
+    """
+    Re-apply our changes to a dictionary on top of theirs, field by field.
+
+    :param base: Dictionary of the common ancestor
+    :param ours: Our version
+    :param theirs: Their version, the result starts from it
+    :param prefix: Dotted path of the dictionary, for the conflict list
+    :return: Tuple of (merged dictionary, list of dotted fields both sides changed)
+    """
+    merged = dict(theirs)
+    conflicts = []
+    for key in sorted(set(base) | set(ours), key=str):
+        base_value, our_value, their_value = base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING)
+        if our_value == base_value or our_value == their_value:
+            continue
+        if their_value == base_value:
+            if our_value is _MISSING:
+                del merged[key]
+            else:
+                merged[key] = our_value
+        elif isinstance(our_value, dict) and isinstance(their_value, dict) and (base_value is _MISSING or isinstance(base_value, dict)):
+            # A dictionary added on both sides merges against an empty one
+            base_value = {} if base_value is _MISSING else base_value
+            merged[key], nested = _merge_fields(base_value, our_value, their_value, f"{prefix}{key}.")
+            conflicts.extend(nested)
+        else:
+            conflicts.append(f"{prefix}{key}")
+    return merged, conflicts
+
+
+def merge_entries(base_entries, our_entries, their_entries):
+    """
+    Three-way merge of index entries keyed by path.
+
+    A path changed on only one side takes that side's version. When both
+    sides changed the same entry, our changes are re-applied on top of
+    theirs field by field (into the manifest too). For fields both sides
+    changed differently their value wins: it was published from a newer
+    checkout, ours may be a stale build racing it. The dropped fields are
+    logged. If one side deleted the entry the other changed, theirs wins.
+
+    :param base_entries: Entries of the common ancestor index
+    :param our_entries: Entries we want to publish
+    :param their_entries: Entries currently published by someone else
+    :return: List of merged entries
+    """
+    base = {entry["path"]: entry for entry in base_entries}
+    ours = {entry["path"]: entry for entry in our_entries}
+    theirs = {entry["path"]: entry for entry in their_entries}
+
+    merged = []
+    for path in sorted(set(base) | set(ours) | set(theirs)):
+        base_entry, our_entry, their_entry = base.get(path), ours.get(path), theirs.get(path)
+
+        if our_entry == their_entry or their_entry == base_entry:
+            result = our_entry
+        elif our_entry == base_entry:
+            result = their_entry
+        elif our_entry is None or their_entry is None:
+            log.warning("Index entry %s was deleted on one side and changed on the other, keeping the published one", path)
+            result = their_entry
+        else:
+            result, conflicts = _merge_fields(base_entry or {}, our_entry, their_entry)
+            if conflicts:
+                log.warning("Conflicting changes to index entry %s, keeping the published %s", path, ", ".join(conflicts))
+
+        # None means the entry was deleted
+        if result is not None:
+            merged.append(result)
+
+    return merged
+
+
+def read_published_index(repo, branch):
+    """
+    Read index.json from a branch through the GitHub API.
+
+    :param repo: PyGithub repository
+    :param branch: Branch name or commit SHA
+    :return: Tuple of (blob SHA or None, list of entries)
+    """
+    from github import GithubException
+
+    try:
+        file_content = repo.get_contents(INDEX_PATH, ref=branch)
+    except GithubException as e:
+        if e.status == 404:
+            return None, []
+        raise
+
+    return file_content.sha, json.loads(file_content.decoded_content.decode("utf-8"))
+
+
+def publish_index(repo, branch="main", root=".", max_retries=5):
+    """
+    Publish the index built from local fragments with optimistic concurrency.
+
+    The index.json of the checkout is the common base, the local fragments
+    are our side and the published index.json is theirs. The write is sent
+    with the SHA of the published file we merged against; if another run
+    published in the meantime it is rejected, merged again and retried.
+
+    :param repo: PyGithub repository
+    :param branch: Branch to publish to
+    :param root: Repository root holding the fragments
+    :param max_retries: Number of retries after a conflicting write
+    :return: True if index.json was updated
+    """
+    from github import GithubException
+
+    base_entries = []
+    index_file = os.path.join(root, INDEX_PATH)
+    if os.path.exists(index_file):
+        with open(index_file, "r", encoding="utf-8") as f:
+            base_entries = json.load(f)
+
+    target_entries = load_fragments(root)
+
+    for attempt in range(max_retries + 1):
+        their_sha, their_entries = read_published_index(repo, branch)
+        target_entries = merge_entries(base_entries, target_entries, their_entries)
+
+        content = render_index(target_entries)
+        if content == render_index(their_entries):
+            print("index.json is up to date")
+            return False
+
+        try:
+            if their_sha:
+                repo.update_file(INDEX_PATH, "chore: rebuild character index", content, their_sha, branch=branch)
+            else:
+                repo.create_file(INDEX_PATH, "chore: rebuild character index", content, branch=branch)
+            print(f"Published {INDEX_PATH} with {len(target_entries)} entries")
+            return True
+        except GithubException as e:
+            # 409 on a stale SHA, 422 when the file was created concurrently
+            if e.status not in (409, 422) or attempt == max_retries:
+                raise
+            log.warning("index.json changed since it was read (attempt %d), merging again", attempt + 1)
+
+        # What we merged against is now the common base of the next attempt
+        base_entries = their_entries
+        retry_pause(attempt)
+
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the character index from its fragments")
+    parser.add_argument("command", choices=["build", "split", "publish"], help="build: merge fragments into index.json, split: create fragments from index.json, publish: build and push index.json through the GitHub API")
+    parser.add_argument("--root", default=".", help="Repository root")
+    parser.add_argument("--branch", default="main", help="Branch to publish to")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries after a conflicting publish")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.root)
+    elif args.command == "split":
+        split_index(args.root)
+    else:
+        repo = make_github(os.environ["GITHUB_TOKEN"]).get_repo(os.environ["GITHUB_REPOSITORY"])
+        publish_index(repo, args.branch, args.root, args.max_retries)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# coalesce.py
+# Debounces bursts of issue events into one run per issue, cancelling runs that were superseded
+import sys
+import json
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class SupersededError(Exception):
+    """
+    Raised inside a run when a newer event for the same key arrived.
+    """
+
+
+class CoalescingQueue:
+    """
+    Collapse events for the same key that arrive within a quiet window.
+
+    A run starts once no event arrived for `window` seconds and gets the
+    latest payload. An event arriving while its key is running sets the
+    run's cancel token; the run is expected to check it at safe points
+    (see check_cancelled()) and stop, then a new run starts with the newer
+    payload after the window. Different keys run in parallel.
+    """
+
+    def __init__(self, run, window=30.0, max_workers=4, clock=time.monotonic):
+        """
+        :param run: Function called as run(key, payload, cancel_event)
+        :param window: Quiet period in seconds before a key is run
+        :param max_workers: Maximum number of keys running at once
+        :param clock: Monotonic clock, replaceable for simulations
+        """
+        self.run = run
+        self.window = window
+        self.max_workers = max_workers
+        self.clock = clock
+        # key -> (payload, deadline, number of events coalesced)
+        self._pending = {}
+        # key -> cancel event of the running run
+        self._running = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self.results = []
+        self._dispatcher = threading.Thread(target=self._dispatch, name='coalesce-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, key, payload):
+        """
+        Queue an event, replacing any pending payload of the same key.
+
+        :param key: Coalescing key, e.g. the issue number
+        :param payload: Latest event data
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Queue is closed")
+            _, _, coalesced = self._pending.get(key, (None, None, 0))
+            self._pending[key] = (payload, self.clock() + self.window, coalesced + 1)
+            if key in self._running:
+                self._running[key].set()
+            self._condition.notify_all()
+
+    def _next_due(self):
+        """
+        Pick a key whose window elapsed and that is not running.
+
+        :return: Tuple of (key or None, seconds to wait before something may be due)
+        """
+        now = self.clock()
+        wait = None
+        for key, (_, deadline, _) in self._pending.items():
+            if key in self._running:
+                continue
+            if deadline <= now:
+                if len(self._running) < self.max_workers:
+                    return key, 0
+                continue
+            wait = deadline - now if wait is None else min(wait, deadline - now)
+        return None, wait
+
+    def _dispatch(self):
+        with self._condition:
+            while True:
+                key, wait = self._next_due()
+                if key is None:
+                    if self._closed and not self._pending and not self._running:
+                        return
+                    self._condition.wait(wait)
+                    continue
+
+                payload, _, coalesced = self._pending.pop(key)
+                cancel_event = threading.Event()
+                self._running[key] = cancel_event
+                threading.Thread(
+                    target=self._run_one, args=(key, payload, coalesced, cancel_event),
+                    name=f'coalesce-{key}', daemon=True
+                ).start()
+
+    def _run_one(self, key, payload, coalesced, cancel_event):
+        started = self.clock()
+        try:
+            self.run(key, payload, cancel_event)
+            status = 'superseded' if cancel_event.is_set() else 'completed'
+            error = None
+        except SupersededError:
+            status, error = 'superseded', None
+        except Exception as e:
+            status, error = 'failed', str(e)
+
+        with self._condition:
+            del self._running[key]
+            self.results.append({
+                'key': key,
+                'status': status,
+                'events': coalesced,
+                'seconds': round(self.clock() - started, 3),
+                'error': error
+            })
+            self._condition.notify_all()
+
+    def close(self, timeout=None):
+        """
+        Stop accepting events and wait until every pending event was run.
+
+        :param timeout: Maximum seconds to wait
+        :return: List of run results, in completion order
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._dispatcher.join(timeout)
+        return self.results
+
+
+def check_cancelled(cancel_event, stage):
+    """
+    Stop a run at a safe point if a newer event superseded it.
+
+    :param cancel_event: threading.Event from the queue, or None outside the queue
+    :param stage: Name of the checkpoint, for the log
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        log.info("Superseded by a newer event, stopping before %s", stage)
+        raise SupersededError(stage)
+
+
+def read_event_feed(source, speed=1.0):
+    """
+    Replay issue events from a JSONL feed, a local stand-in for GitHub webhooks.
+
+    Each line is {"issue": 12, "action": "edited", "body": "...", "at": 3.5}
+    where "at" is the time in seconds since the start of the feed. Events
+    are yielded at their time divided by `speed`; lines without "at" are
+    yielded immediately.
+
+    :param source: Path of the feed, or '-' for stdin
+    :param speed: Replay speed factor
+    :return: Generator of event dictionaries
+    """
+    f = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    start = time.monotonic()
+    try:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if 'at' in event:
+                delay = start + event['at'] / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield event
+    finally:
+        if f is not sys.stdin:
+            f.close()
@@ -1,67 +1,100 @@
 # contribution-processor.py
 import os
 import re
+import sys
+import argparse
+import atexit
+import logging
 import json
-import yaml
 import base64
-import gzip
-import io
-import zipfile
-import requests
-from urllib.parse import urlparse, parse_qs
-from github import Github
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
+from download_cache import DownloadCache
+from dexie_export import build_character_export, character_row
+from issue_form import get_form_parser
+from category_registry import get_registry
+from character_index import fragment_path, make_entry, relative_character_path, render_fragment
+from submission_ledger import find_ledger, share_file_id, submission_hash, write_ledger
+from coalesce import CoalescingQueue, SupersededError, check_cancelled, read_event_feed
+from spool import DirectorySpool
+from github_client import get_scheduler, git_blob_sha, make_github
+from api_usage import ApiUsage, api_stage, configure as configure_api_usage
+from tracing import configure_logging, configure_profiling, enable_tracing, profile_if_selected, span, traced, write_chrome_trace
+
+# PyGithub takes a large share of the start-up time, it is imported where a client is created
+
+# Commits cached by a long running worker before the cache is dropped
+MAX_CACHED_COMMIT_TREES = 256
+
+log = logging.getLogger('contribution-processor')
+
+def pipeline_stage(name):
+    """
+    Decorator timing a ContributionProcessor method as a trace span and attributing its requests to a stage.
+    
+    :param name: Stage name
+    """
+    def decorator(method):
+        return traced(name)(api_stage(name)(method))
+    return decorator
 
 class ContributionProcessor:
-    def __init__(self, github_token, issue_number):
+    def __init__(self, github_token, issue_number, repo=None, issue=None, commit_trees=None, body=None, cancel_event=None,
+                 download_cache=None):
         """
         Initialize the contribution processor with GitHub credentials and issue details.
         
         :param github_token: GitHub authentication token
         :param issue_number: Number of the issue to process
+        :param repo: Already loaded repository to reuse (batch mode)
+        :param issue: Already loaded issue to reuse (batch mode)
+        :param commit_trees: Commit SHA -> tree cache shared between processors (batch mode)
+        :param body: Issue body to process instead of the one loaded with the issue (feed mode)
+        :param cancel_event: threading.Event set when a newer edit supersedes this run (feed mode)
+        :param download_cache: DownloadCache to reuse, keeps its HTTP session warm (worker mode)
         """
-        self.g = Github(github_token)
-        self.repo = self.g.get_repo(os.environ.get('GITHUB_REPOSITORY'))
-        self.issue = self.repo.get_issue(issue_number)
-        self.body = self.parse_issue_body(self.issue.body)
+        # Requests of this run per pipeline stage, see api_usage.py
+        self.api_usage = ApiUsage(issue_number)
+        with span('load_issue'), self.api_usage.stage('load_issue'):
+            if repo is None:
+                self.g = make_github(github_token)
+                repo = self.g.get_repo(os.environ.get('GITHUB_REPOSITORY'))
+            self.repo = repo
+            self.issue = issue or self.repo.get_issue(issue_number)
+        self.body = self.parse_issue_body(self.issue.body if body is None else body)
+        self.cancel_event = cancel_event
+        # 'atomic' (one commit per contribution) or 'per-file' (legacy)
+        self.commit_mode = os.environ.get('COMMIT_MODE', 'atomic').lower()
+        # Branch name -> {path: blob SHA}, filled lazily from one recursive tree read
+        self._tree_snapshots = {}
+        self._truncated_trees = set()
+        # Commit SHA -> ({path: blob SHA}, truncated), branches created from the same commit share it
+        self._commit_trees = {} if commit_trees is None else commit_trees
+        self.download_cache = download_cache or DownloadCache.from_environment()
+        self.character_gz_level = int(os.environ.get('CHARACTER_GZ_LEVEL', '9'))
+        self.skipped_files = 0
+        # Process even when the ledger says the submission was already processed
+        self.force = os.environ.get('FORCE_REPROCESS', '').lower() in ('1', 'true', 'yes')
+        self.unchanged = False
 
+    @pipeline_stage('parse_issue_body')
     def parse_issue_body(self, body):
         """
-        Parse the issue body, handling potential parsing challenges.
+        Parse the issue body into fields keyed by their label (e.g. 'content_name').
+        
+        Field types come from the contribution issue template: multi-select
+        categories are lists, textareas keep their full content.
         
         :param body: Raw issue body text
         :return: Dictionary of parsed fields
         """
-        fields = {}
-        
-        # Split by ### but keep the section headers
-        sections = body.split('###')
+        fields = get_form_parser(key='label').parse(body)
         
-        for section in sections[1:]:  # Skip first empty section
-            # Split into lines and remove empty ones
-            lines = [line.strip() for line in section.split('\n') if line.strip()]
-            
-            if not lines:  # Skip empty sections
-                continue
-                
-            # Get the section name from first line and convert to field name
-            key = lines[0].strip().lower().replace(' ', '_')
-            
-            # For certain fields, join all remaining lines
-            if key in ['readme_content', 'custom_code', 'lorebook_content']:
-                value = '\n'.join(lines[1:]).strip()
-            else:
-                # For other fields, take just the first non-empty line after the header
-                value = lines[1] if len(lines) > 1 else ''
-                
-                # Clean up common formatting issues
-                value = value.replace('_No response_', '')  # Remove "_No response_" placeholders
-                value = value.strip()  # Remove any extra whitespace
-            
-            fields[key] = value
-            
-            # Debug print to help track what's being parsed
-            print(f"DEBUG: Parsed field {key} = {value[:50]}...")
+        # Help track what's being parsed, without formatting every field when nobody reads it
+        if log.isEnabledFor(logging.DEBUG):
+            for key, value in fields.items():
+                log.debug("Parsed field %s = %.50s...", key, value)
         
         return fields
 
@@ -74,6 +107,25 @@ class ContributionProcessor:
         """
         return re.sub(r'[<>:"/\\|?*]', '_', name)
 
+    # Form fields the branch, the files and the pull request are built from, besides the
+    # category fields. Keep in sync with the process_* methods below, only these are hashed
+    # for the ledger, so edits to anything else (e.g. the terms checkboxes) are no-ops
+    SUBMISSION_FIELDS = (
+        'content_type', 'content_name', 'author', 'author_name', 'rating', 'content_rating_(required)',
+        'description', 'short_description', 'image_url_for_your_content', 'perchance_character_share_link',
+        'lorebook_content', 'readme_content'
+    )
+
+    def submission_fields(self, registry):
+        """
+        Get the form fields the processor output depends on.
+
+        :param registry: CategoryRegistry, every category except the rating is read from its field
+        :return: Dictionary of field name -> value, fields missing from the form are left out
+        """
+        names = list(self.SUBMISSION_FIELDS)
+        names.extend(category['name'].lower() for category in registry.categories if category['name'].lower() != 'rating')
+        return {name: self.body[name] for name in names if name in self.body}
 
     def process_lorebook(self, branch_name):
         """
@@ -108,7 +160,7 @@ class ContributionProcessor:
             }
         ]
         
-        self._commit_files(branch_name, files_to_commit)
+        self._commit_files(branch_name, files_to_commit, f"Add lorebook {content_name}")
 
     def process_custom_code(self, branch_name):
         """
@@ -128,7 +180,7 @@ class ContributionProcessor:
         :param branch_name: Branch to commit files to
         :return: Boolean indicating success
         """
-        print("DEBUG: Processing character contribution")
+        log.debug("Processing character contribution")
         
         # Get basic information
         content_name = self.sanitize_filename(self.body.get('content_name', 'unnamed'))
@@ -141,6 +193,7 @@ class ContributionProcessor:
             
         # Process the character file
         character_files = self.download_and_process_character_file(share_url)
+        check_cancelled(self.cancel_event, 'building the character files')
         
         # Set up paths
         base_path = "ai-character-chat/characters"
@@ -149,8 +202,7 @@ class ContributionProcessor:
         
         # Auto-categorize content
         # Load categories configuration
-        with open('categories.json', 'r') as f:
-            categories_config = json.load(f)
+        registry = get_registry()
         
         # Create categories dictionary dynamically
         categories = {
@@ -158,17 +210,19 @@ class ContributionProcessor:
         }
         
         # Populate other categories dynamically from categories.json
-        for category in categories_config:
+        for category in registry.categories:
             category_name = category['name'].lower()
             if category_name != 'rating':  # Skip rating as it's handled separately
                 # Get the value from body if it exists, otherwise use empty list
                 category_value = self.body.get(category_name.lower(), '')
                 if category_value:
-                    # If multiple values are selected (comma-separated), split them
-                    if isinstance(category_value, str) and ',' in category_value:
-                        categories[category_name] = [v.strip() for v in category_value.split(',')]
+                    # Multi-select answers are already lists, split legacy comma-separated strings
+                    if isinstance(category_value, list):
+                        values = category_value
                     else:
-                        categories[category_name] = [category_value]
+                        values = [v.strip() for v in category_value.split(',')]
+                    # Use the canonical spelling of known tags
+                    categories[category_name] = [registry.canonical_tag(category_name, v, rating) or v for v in values]
                 elif category['required']:
                     # For required categories with no value, use first general tag as default
                     #categories[category_name] = [category['tags']['general'][0]]
@@ -200,7 +254,8 @@ class ContributionProcessor:
         }
     
         # Create changelog.json
-        now = datetime.datetime.utcnow().isoformat() + 'Z'    # Date and time in ISO 8601 (UTC)
+        # Date and time of the submission in ISO 8601 (UTC), stable across issue edits
+        now = self._submission_time().replace(tzinfo=None).isoformat() + 'Z'
         changelog = {
             'currentVersion': '1.0.0',
             'created': now,
@@ -234,12 +289,12 @@ class ContributionProcessor:
             }
         ]
 
-        # Update index.json
-        updated_index = self.update_character_index(char_path, manifest)
+        # Add the character's index fragment
+        index_fragment_path, index_fragment = self.update_character_index(char_path, manifest)
         files_to_commit.append({
-            'path': "ai-character-chat/characters/index.json",
-            'content': updated_index,
-            'message': f'Update index.json with {content_name}'
+            'path': index_fragment_path,
+            'content': index_fragment,
+            'message': f'Add index entry for {content_name}'
         })
         
         # Add character files
@@ -251,11 +306,12 @@ class ContributionProcessor:
             })
             
         # Commit all files
-        print(f"DEBUG: Committing {len(files_to_commit)} files for character")
-        self._commit_files(branch_name, files_to_commit)
+        log.debug("Committing %d files for character", len(files_to_commit))
+        self._commit_files(branch_name, files_to_commit, f"Add character {content_name} by {author_name}")
         
         return True
 
+    @pipeline_stage('download_and_process_character_file')
     def download_and_process_character_file(self, share_url):
         """
         Download and process character file from Perchance share URL.
@@ -265,78 +321,52 @@ class ContributionProcessor:
         """
         try:
             # Extract file ID from share URL
-            parsed_url = urlparse(share_url)
-            query_params = parse_qs(parsed_url.query)
-            data_param = query_params.get('data', [''])[0]
-            file_id = data_param.split('~')[-1]
+            file_id = share_file_id(share_url)
             
             if not file_id.endswith('.gz'):
                 raise ValueError("Invalid share URL format")
             
-            # Download file from Perchance
-            download_url = f"https://user-uploads.perchance.org/file/{file_id}"
-            response = requests.get(download_url, timeout=15)
-            response.raise_for_status()
-            
-            # Decompress gzip content
-            with gzip.GzipFile(fileobj=io.BytesIO(response.content)) as gz_file:
-                json_content = gz_file.read().decode('utf-8')
+            # Stream the file from Perchance to disk, or reuse it from the local cache
+            file_path = self.download_cache.fetch(file_id, timeout=15)
             
-            # Parse JSON content
-            character_data = json.loads(json_content)
+            try:
+                # Decompress in chunks, failing early on oversized content
+                json_content = self.download_cache.read_gzip(file_path)
+                
+                # Parse JSON content (json.loads decodes the UTF-8 bytes itself)
+                character_data = json.loads(json_content)
+                del json_content
+            except Exception:
+                # A truncated or corrupt file would otherwise fail every later run from the cache
+                self.download_cache.discard(file_id)
+                raise
             character_info = character_data.get('addCharacter', {})
             
             return self.create_character_files(character_info)
             
         except Exception as e:
-            print(f"ERROR: Failed to process character file: {str(e)}")
+            log.error("Failed to process character file: %s", e)
             raise
             
+    @pipeline_stage('update_character_index')
     def update_character_index(self, character_path, manifest_data):
         """
-        Update the character index file with new character information.
+        Create the index fragment for a character.
+        
+        Only the character's own fragment under index.d/ is written; the
+        combined index.json is rebuilt from all fragments by character_index.py.
         
         :param character_path: Relative path to character directory
         :param manifest_data: Character manifest data
-        :return: Updated index content
+        :return: Tuple of (fragment path, fragment content)
         """
-        index_path = "ai-character-chat/characters/index.json"
-        
         try:
-            # Try to get existing index file
-            try:
-                file_content = self.repo.get_contents(index_path)
-                index_content = file_content.decoded_content.decode('utf-8')
-                index_data = json.loads(index_content)
-            except Exception as e:
-                print(f"DEBUG: No existing index.json found or error reading it: {str(e)}")
-                # If file doesn't exist, start with empty list
-                index_data = []
-            
-            # Remove path prefix to match index format
-            relative_path = character_path.replace("ai-character-chat/characters/", "")
-            
-            # Create new character entry
-            new_entry = {
-                "path": relative_path,
-                "manifest": manifest_data
-            }
-            
-            # Check if character already exists (by path)
-            existing_index = next((i for i, item in enumerate(index_data) 
-                                 if item["path"] == relative_path), None)
-            
-            if existing_index is not None:
-                # Update existing entry
-                index_data[existing_index] = new_entry
-            else:
-                # Add new entry
-                index_data.append(new_entry)
-            
-            return json.dumps(index_data, indent=2)
+            relative_path = relative_character_path(character_path)
+            entry = make_entry(relative_path, manifest_data)
+            return fragment_path(relative_path), render_fragment(entry)
             
         except Exception as e:
-            print(f"ERROR: Failed to update character index: {str(e)}")
+            log.error("Failed to update character index: %s", e)
             raise
             
     def create_character_files(self, character_info):
@@ -374,124 +404,211 @@ class ContributionProcessor:
                 files[f"src/{field}.{format_type}"] = content
 
     
-        # Create character.gz containing the original data
-        gz_buffer = io.BytesIO()
-        with gzip.GzipFile(fileobj=gz_buffer, mode='wb') as gz_file:
-            # Format data according to the export template
-            export_data = {
-                "formatName": "dexie",
-                "formatVersion": 1,
-                "data": {
-                    "databaseName": "chatbot-ui-v1",
-                    "databaseVersion": 90,
-                    "tables": [
-                        {
-                            "name": "characters",
-                            "schema": "++id,modelName,fitMessagesInContextMethod,uuid,creationTime,lastMessageTime",
-                            "rowCount": 1
-                        },
-                        # Add other table schemas with rowCount 0
-                        {"name": "threads", "schema": "++id,name,characterId,creationTime,lastMessageTime,lastViewTime", "rowCount": 0},
-                        {"name": "messages", "schema": "++id,threadId,characterId,creationTime,order", "rowCount": 0},
-                        {"name": "misc", "schema": "key", "rowCount": 0},
-                        {"name": "summaries", "schema": "hash,threadId", "rowCount": 0},
-                        {"name": "memories", "schema": "++id,[summaryHash+threadId],[characterId+status],[threadId+status],[threadId+index],threadId", "rowCount": 0},
-                        {"name": "lore", "schema": "++id,bookId,bookUrl", "rowCount": 0},
-                        {"name": "textEmbeddingCache", "schema": "++id,textHash,&[textHash+modelName]", "rowCount": 0},
-                        {"name": "textCompressionCache", "schema": "++id,uncompressedTextHash,&[uncompressedTextHash+modelName+tokenLimit]", "rowCount": 0},
-                        {"name": "usageStats", "schema": "[dateHour+threadId+modelName],threadId,characterId,dateHour", "rowCount": 0}
-                    ],
-                    "data": [
-                        {
-                            "tableName": "characters",
-                            "inbound": True,
-                            "rows": [{
-                                **character_info,
-                                "id": 1,
-                                "creationTime": int(datetime.datetime.now().timestamp() * 1000),
-                                "lastMessageTime": int(datetime.datetime.now().timestamp() * 1000),
-                                "$types": {
-                                    "maxParagraphCountPerMessage": "undef",
-                                    "initialMessages": "arrayNonindexKeys",
-                                    "shortcutButtons": "arrayNonindexKeys",
-                                    "loreBookUrls": "arrayNonindexKeys"
-                                }
-                            }]
-                        },
-                        # Add other empty tables
-                        {"tableName": "threads", "inbound": True, "rows": []},
-                        {"tableName": "messages", "inbound": True, "rows": []},
-                        {"tableName": "misc", "inbound": True, "rows": []},
-                        {"tableName": "summaries", "inbound": True, "rows": []},
-                        {"tableName": "memories", "inbound": True, "rows": []},
-                        {"tableName": "lore", "inbound": True, "rows": []},
-                        {"tableName": "textEmbeddingCache", "inbound": True, "rows": []},
-                        {"tableName": "textCompressionCache", "inbound": True, "rows": []},
-                        {"tableName": "usageStats", "inbound": True, "rows": []}
-                    ]
-                }
-            }
-            gz_file.write(json.dumps(export_data, indent=2).encode('utf-8'))
-        
-        files['character.gz'] = gz_buffer.getvalue()
+        # Create character.gz containing the original data as a Dexie export
+        # Timestamps come from the submission and the gzip mtime is fixed so re-runs produce identical bytes
+        created_ms = int(self._submission_time().timestamp() * 1000)
+        files['character.gz'] = build_character_export(
+            character_row(character_info, created_ms),
+            compresslevel=self.character_gz_level
+        )
         
         return files
 
-    def create_contribution_branch(self):
+    def _submission_time(self):
         """
-        Create a new branch for the contribution from the main branch.
+        Get the time the contribution was submitted (issue creation, UTC).
+        
+        :return: Timezone-aware datetime
         """
-        base_branch = self.repo.get_branch('main')
+        created_at = self.issue.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+        return created_at.astimezone(datetime.timezone.utc)
+
+    def get_branch_name(self):
+        """
+        Get the name of the contribution branch for this issue.
         
+        :return: Branch name
+        """
         author_name = self.body.get('author_name', self.issue.user.login).strip()
         fallback_name = str(self.issue.number)
         
         branch_safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', author_name or fallback_name)
-        branch_name = f'contribution/{branch_safe_name}'
+        return f'contribution/{branch_safe_name}'
+
+    @pipeline_stage('create_contribution_branch')
+    def create_contribution_branch(self):
+        """
+        Create a new branch for the contribution from the main branch.
+        """
+        base_branch = self.repo.get_branch('main')
+        branch_name = self.get_branch_name()
         
-        print(f"DEBUG: Creating branch {branch_name}")
+        log.debug("Creating branch %s", branch_name)
         
         try:
             # Check if branch exists
             existing_branch = self.repo.get_branch(branch_name)
-            print(f"DEBUG: Branch {branch_name} already exists, will reuse")
+            log.debug("Branch %s already exists, will reuse", branch_name)
         except:
             # Create branch from main
             ref = f'refs/heads/{branch_name}'
             self.repo.create_git_ref(ref, base_branch.commit.sha)
-            print(f"DEBUG: Created new branch {branch_name}")
+            log.debug("Created new branch %s", branch_name)
         
         return branch_name
 
-    def _get_file_sha(self, file_path, branch_name):
+    def _get_tree_snapshot(self, branch_name, refresh=False):
+        """
+        Get a path -> blob SHA map of the branch, fetched once per run.
+        
+        :param branch_name: Name of the branch to snapshot
+        :param refresh: Re-fetch the tree even if a snapshot is cached
+        :return: Dictionary mapping file paths to blob SHAs
+        """
+        if refresh or branch_name not in self._tree_snapshots:
+            ref = self.repo.get_git_ref(f'heads/{branch_name}')
+            commit_sha = ref.object.sha
+            
+            if commit_sha not in self._commit_trees:
+                tree = self.repo.get_git_tree(commit_sha, recursive=True)
+                blobs = {
+                    element.path: element.sha
+                    for element in tree.tree
+                    if element.type == 'blob'
+                }
+                self._commit_trees[commit_sha] = (blobs, bool(tree.raw_data.get('truncated')))
+            
+            # Copy, the branch snapshot is updated as files get written
+            blobs, truncated = self._commit_trees[commit_sha]
+            self._tree_snapshots[branch_name] = dict(blobs)
+            
+            # Very large trees come back truncated, misses must then be checked individually
+            if truncated:
+                self._truncated_trees.add(branch_name)
+            else:
+                self._truncated_trees.discard(branch_name)
+            
+            log.debug("Snapshot of %s has %d files", branch_name, len(self._tree_snapshots[branch_name]))
+        
+        return self._tree_snapshots[branch_name]
+
+    def _get_file_sha(self, file_path, branch_name, refresh=False):
         """
         Get the SHA of an existing file in the specified branch.
         
         :param file_path: Path to the file in the repository
         :param branch_name: Name of the branch to check
+        :param refresh: Re-fetch the branch tree before the lookup
         :return: SHA string or None if file doesn't exist
         """
-        try:
-            # Get the file content from the specific branch
-            file_content = self.repo.get_contents(file_path, ref=branch_name)
-            return file_content.sha
-        except Exception as e:
+        snapshot = self._get_tree_snapshot(branch_name, refresh=refresh)
+        file_sha = snapshot.get(file_path)
+        
+        if file_sha is None and branch_name in self._truncated_trees:
             try:
-                # If file doesn't exist in the branch, try main branch
-                file_content = self.repo.get_contents(file_path, ref='main')
-                return file_content.sha
+                file_sha = self.repo.get_contents(file_path, ref=branch_name).sha
+                snapshot[file_path] = file_sha
             except Exception as e:
-                print(f"DEBUG: File {file_path} not found in either branch: {str(e)}")
-                return None
+                log.debug("File %s not found in %s: %s", file_path, branch_name, e)
+        
+        return file_sha
             
-    def _commit_files(self, branch_name, files):
+    @pipeline_stage('_commit_files')
+    def _commit_files(self, branch_name, files, commit_message=None):
         """
         Commit multiple files to a specific branch.
         
+        Files whose content already matches the branch are skipped. In
+        'atomic' mode (default) the rest are uploaded as blobs and the
+        branch is moved to a single new commit. 'per-file' mode keeps the
+        old behaviour of one Contents API commit per file.
+        
+        :param branch_name: Target branch
+        :param files: List of file dictionaries with path, content, and message
+        :param commit_message: Message for the atomic commit (defaults to the first file's message)
+        :return: Number of files written
+        """
+        snapshot = self._get_tree_snapshot(branch_name)
+        changed_files = [
+            file_info for file_info in files
+            if snapshot.get(file_info['path']) != git_blob_sha(file_info['content'])
+        ]
+        
+        skipped = len(files) - len(changed_files)
+        self.skipped_files += skipped
+        log.debug("%d changed, %d unchanged files skipped on %s", len(changed_files), skipped, branch_name)
+        
+        if not changed_files:
+            return 0
+        
+        # Last safe point, nothing has been written to the branch yet
+        check_cancelled(self.cancel_event, 'committing')
+        
+        if self.commit_mode == 'per-file':
+            self._commit_files_per_file(branch_name, changed_files)
+        else:
+            self._commit_files_atomic(branch_name, changed_files, commit_message)
+        
+        return len(changed_files)
+
+    def _commit_files_atomic(self, branch_name, files, commit_message=None):
+        """
+        Commit all files to a branch as one commit using the Git Data API.
+        
+        :param branch_name: Target branch
+        :param files: List of file dictionaries with path, content, and message
+        :param commit_message: Commit subject line
+        """
+        if not files:
+            return
+        
+        from github import InputGitTreeElement
+        
+        log.debug("Attempting atomic commit of %d files to branch %s", len(files), branch_name)
+        
+        ref = self.repo.get_git_ref(f'heads/{branch_name}')
+        parent = self.repo.get_git_commit(ref.object.sha)
+        
+        tree_elements = []
+        blob_shas = {}
+        for file_info in files:
+            path = file_info['path']
+            content = file_info['content']
+            
+            # Text goes up as-is, binary content (e.g. character.gz) as base64
+            if isinstance(content, str):
+                blob = self.repo.create_git_blob(content, 'utf-8')
+            else:
+                blob = self.repo.create_git_blob(base64.b64encode(content).decode('ascii'), 'base64')
+            
+            log.debug("Uploaded blob %s for %s", blob.sha, path)
+            tree_elements.append(InputGitTreeElement(path=path, mode='100644', type='blob', sha=blob.sha))
+            blob_shas[path] = blob.sha
+        
+        # Keep the per-file messages in the commit body so nothing is lost
+        subject = commit_message or files[0]['message']
+        details = '\n'.join(f"- {file_info['message']}" for file_info in files)
+        message = f"{subject}\n\n{details}" if len(files) > 1 else subject
+        
+        tree = self.repo.create_git_tree(tree_elements, base_tree=parent.tree)
+        commit = self.repo.create_git_commit(message, tree, [parent])
+        ref.edit(commit.sha)
+        
+        if branch_name in self._tree_snapshots:
+            self._tree_snapshots[branch_name].update(blob_shas)
+        
+        log.debug("Branch %s moved to commit %s", branch_name, commit.sha)
+
+    def _commit_files_per_file(self, branch_name, files):
+        """
+        Commit multiple files to a specific branch, one commit per file.
+        
         :param branch_name: Target branch
         :param files: List of file dictionaries with path, content, and message
         """
-        print(f"DEBUG: Attempting to commit {len(files)} files to branch {branch_name}")
+        log.debug("Attempting to commit %d files to branch %s", len(files), branch_name)
         
         for file_info in files:
             try:
@@ -499,7 +616,7 @@ class ContributionProcessor:
                 content = file_info['content']
                 message = file_info['message']
                 
-                print(f"DEBUG: Creating/updating file {path}")
+                log.debug("Creating/updating file %s", path)
                 
                 # Convert content to base64 if it's not already
                 if isinstance(content, str):
@@ -509,44 +626,55 @@ class ContributionProcessor:
                 file_sha = self._get_file_sha(path, branch_name)
                 
                 try:
-                    if file_sha:
-                        print(f"DEBUG: Updating existing file {path} with SHA {file_sha}")
-                        self.repo.update_file(
-                            path=path,
-                            message=message,
-                            content=content,
-                            sha=file_sha,
-                            branch=branch_name
-                        )
-                    else:
-                        print(f"DEBUG: Creating new file {path}")
-                        self.repo.create_file(
-                            path=path,
-                            message=message,
-                            content=content,
-                            branch=branch_name
-                        )
-                    print(f"DEBUG: Successfully created/updated file {path}")
+                    result = self._write_file(branch_name, path, content, message, file_sha)
                 except Exception as commit_error:
-                    print(f"WARNING: First commit attempt failed: {str(commit_error)}")
-                    # If update fails, try to get SHA again and retry
-                    file_sha = self._get_file_sha(path, 'main')
+                    log.warning("First commit attempt failed: %s", commit_error)
+                    # The snapshot may be stale (e.g. another run pushed), refresh it and retry
+                    file_sha = self._get_file_sha(path, branch_name, refresh=True)
                     if file_sha:
-                        print(f"DEBUG: Retrying update with main branch SHA {file_sha}")
-                        self.repo.update_file(
-                            path=path,
-                            message=message,
-                            content=content,
-                            sha=file_sha,
-                            branch=branch_name
-                        )
+                        log.debug("Retrying update with refreshed SHA %s", file_sha)
+                        result = self._write_file(branch_name, path, content, message, file_sha)
                     else:
                         raise
                 
+                self._tree_snapshots[branch_name][path] = result['content'].sha
+                
             except Exception as e:
-                print(f"ERROR: Failed to commit file {file_info['path']}: {str(e)}")
+                log.error("Failed to commit file %s: %s", file_info['path'], e)
                 raise
 
+    def _write_file(self, branch_name, path, content, message, file_sha):
+        """
+        Create or update a single file through the Contents API.
+        
+        :param branch_name: Target branch
+        :param path: Path of the file in the repository
+        :param content: File content as bytes
+        :param message: Commit message
+        :param file_sha: SHA of the existing file, None to create it
+        :return: Result dictionary from PyGithub with 'content' and 'commit'
+        """
+        if file_sha:
+            log.debug("Updating existing file %s with SHA %s", path, file_sha)
+            result = self.repo.update_file(
+                path=path,
+                message=message,
+                content=content,
+                sha=file_sha,
+                branch=branch_name
+            )
+        else:
+            log.debug("Creating new file %s", path)
+            result = self.repo.create_file(
+                path=path,
+                message=message,
+                content=content,
+                branch=branch_name
+            )
+        log.debug("Successfully created/updated file %s", path)
+        return result
+
+    @pipeline_stage('create_pull_request')
     def create_pull_request(self, branch_name):
         """
         Create a pull request from the contribution branch to main.
@@ -558,6 +686,12 @@ class ContributionProcessor:
 
         content_type = self.body.get('content_type', '').strip() or ''
         
+        # Earlier runs for this branch already opened a PR, the new commits are on it
+        existing = self.repo.get_pulls(state='open', head=f"{self.repo.owner.login}:{branch_name}", base='main')
+        for pr in existing:
+            log.debug("Reusing open pull request #%d", pr.number)
+            return pr
+        
         pr = self.repo.create_pull(
             title=f"[{content_type} Contribution]: {self.body.get('content_name', 'Unnamed')} by {self.body.get('author_name') or self.issue.user.login or 'Anonymous'}",
             body=f"Closes #{self.issue.number}\n\nContribution by @{self.issue.user.login}",
@@ -569,19 +703,45 @@ class ContributionProcessor:
         try:
             self.issue.add_to_labels("PR Generated")
         except Exception as e:
-            print(f"WARNING: Failed to add PR Generated label to issue: {str(e)}")
+            log.warning("Failed to add PR Generated label to issue: %s", e)
             
         return pr
 
     def process(self):
         """
         Main processing method to handle different contribution types.
+        
+        The requests of the run are summarized per stage, see api_usage.py,
+        and each stage is timed as a trace span, see tracing.py.
         """
-        print(f"DEBUG: Starting process with body: {self.body}")
+        status = 'failed'
+        try:
+            with profile_if_selected(self.issue.number), span('process', issue=self.issue.number), self.api_usage.stage('process'):
+                pr = self._process()
+            status = 'unchanged' if self.unchanged else 'success'
+            return pr
+        except SupersededError:
+            status = 'superseded'
+            raise
+        finally:
+            self.api_usage.finish(status)
+
+    def _process(self):
+        log.debug("Starting process with body: %s", self.body)
         
         content_type = self.body.get('content_type', '').lower().strip()
-        print(f"DEBUG: Content type identified as: {content_type}")
+        log.debug("Content type identified as: %s", content_type)
+        
+        # Edits that change nothing the output depends on cost one comment read
+        registry = get_registry()
+        digest = submission_hash(self.submission_fields(registry), self.issue.user.login, self.body.get('perchance_character_share_link', ''), registry.content_hash)
+        ledger_comment, ledger = find_ledger(self.issue)
+        if ledger and ledger.get('hash') == digest and not self.force:
+            log.info("Submission unchanged since %s (PR: %s), skipping", ledger.get('processed_at'), ledger.get('pull_request'))
+            self.unchanged = True
+            return None
         
+        check_cancelled(self.cancel_event, 'creating the branch')
         branch_name = self.create_contribution_branch()
         files_committed = False
         
@@ -594,7 +754,7 @@ class ContributionProcessor:
                 files_committed = self.process_character(branch_name)
             
             if not files_committed:
-                print("DEBUG: No files committed, creating placeholder")
+                log.debug("No files committed, creating placeholder")
                 placeholder_content = f"""Contribution from issue #{self.issue.number}
     Content Type: {content_type}
     Author: {self.body.get('author_name') or self.issue.user.login or 'Unknown'}
@@ -605,20 +765,295 @@ class ContributionProcessor:
                     'message': f'Add placeholder for {content_type} contribution'
                 }])
             
-            print("DEBUG: Creating pull request")
+            log.info("Skipped %d unchanged files", self.skipped_files)
+            
+            check_cancelled(self.cancel_event, 'creating the pull request')
+            log.debug("Creating pull request")
             pr = self.create_pull_request(branch_name)
+            
+            try:
+                write_ledger(self.issue, ledger_comment, digest, branch_name, pr.number if pr else None)
+            except Exception as e:
+                # Only costs a full run next time
+                log.warning("Failed to update the ledger comment: %s", e)
             return pr
         
         except Exception as e:
-            print(f"ERROR in process: {str(e)}")
+            log.error("Failed to process issue #%d: %s", self.issue.number, e)
             raise
 
+def parse_issue_numbers(spec):
+    """
+    Parse a list of issue numbers and ranges, e.g. "12,15,20-25".
+    
+    :param spec: Comma separated issue numbers or inclusive ranges
+    :return: Sorted list of unique issue numbers
+    """
+    numbers = set()
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            numbers.update(range(int(start), int(end) + 1))
+        else:
+            numbers.add(int(part))
+    return sorted(numbers)
+
+def run_batch(github_token, issue_numbers=None, label=None, workers=4, report_path=None):
+    """
+    Process many contribution issues with one GitHub client and a bounded worker pool.
+    
+    Issues that target the same contribution branch are processed one after
+    another by the same worker so their commits do not race.
+    
+    :param github_token: GitHub authentication token
+    :param issue_numbers: List of issue numbers to process
+    :param label: Process every open issue with this label
+    :param workers: Maximum number of issues processed in parallel
+    :param report_path: Optional path of a JSON report with per-issue results
+    :return: List of per-issue result dictionaries
+    """
+    g = make_github(github_token)
+    repo = g.get_repo(os.environ.get('GITHUB_REPOSITORY'))
+    commit_trees = {}
+    
+    issues = {}
+    for number in issue_numbers or []:
+        issues[number] = None
+    if label:
+        for issue in repo.get_issues(state='open', labels=[label]):
+            if issue.pull_request is None:
+                issues[issue.number] = issue
+    
+    log.info("Batch processing %d issues with %d workers", len(issues), workers)
+    results = {}
+    
+    def load(number):
+        return ContributionProcessor(github_token, number, repo=repo, issue=issues[number], commit_trees=commit_trees)
+    
+    def process_group(processors):
+        group_results = []
+        for processor in processors:
+            result = {'issue': processor.issue.number, 'branch': processor.get_branch_name()}
+            try:
+                pr = processor.process()
+                result.update(status='success', pull_request=pr.number if pr else None, skipped_files=processor.skipped_files, unchanged=processor.unchanged)
+            except Exception as e:
+                result.update(status='failed', error=str(e))
+            group_results.append(result)
+        return group_results
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Load issues in parallel, then group them by target branch
+        groups = {}
+        futures = {executor.submit(load, number): number for number in issues}
+        for future in as_completed(futures):
+            number = futures[future]
+            try:
+                processor = future.result()
+            except Exception as e:
+                results[number] = {'issue': number, 'status': 'failed', 'error': f"Failed to load issue: {str(e)}"}
+                continue
+            groups.setdefault(processor.get_branch_name(), []).append(processor)
+        
+        futures = [
+            executor.submit(process_group, sorted(group, key=lambda p: p.issue.number))
+            for group in groups.values()
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                results[result['issue']] = result
+    
+    report = [results[number] for number in sorted(results)]
+    for result in report:
+        if result['status'] == 'success' and result['unchanged']:
+            log.info("#%d: unchanged, skipped", result['issue'])
+        elif result['status'] == 'success':
+            log.info("#%d: success (PR: %s, skipped %d unchanged files)", result['issue'], result.get('pull_request'), result['skipped_files'])
+        else:
+            log.error("#%d: FAILED - %s", result['issue'], result['error'])
+    
+    failed = sum(1 for result in report if result['status'] != 'success')
+    log.info("Batch finished: %d succeeded, %d failed", len(report) - failed, failed)
+    stats = get_scheduler()[0].stats
+    log.info("GitHub API: %d requests, %d served by ETag, %d rate limited, %.0fs waited",
+             stats['requests'], stats['conditional_hits'], stats['rate_limited'], stats['waited_seconds'])
+    
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    return report
+
+def run_feed(github_token, feed, window=30.0, workers=4, speed=1.0, dry_run=False, report_path=None):
+    """
+    Process issue events from a feed, coalescing bursts of edits to the same issue.
+    
+    Events for one issue within `window` seconds of each other become one
+    run on the latest body. A run still in progress when a newer event
+    arrives stops at its next checkpoint, before writing anything else.
+    
+    :param github_token: GitHub authentication token (unused with dry_run)
+    :param feed: Path of a JSONL event feed, see coalesce.read_event_feed()
+    :param window: Quiet period in seconds before an issue is processed
+    :param workers: Maximum number of issues processed in parallel
+    :param speed: Replay speed factor of the feed
+    :param dry_run: Only parse the bodies, without touching GitHub
+    :param report_path: Optional path of a JSON report with per-run results
+    :return: List of run result dictionaries
+    """
+    repo = None
+    commit_trees = {}
+    if not dry_run:
+        repo = make_github(github_token).get_repo(os.environ.get('GITHUB_REPOSITORY'))
+    
+    def run(issue_number, event, cancel_event):
+        if dry_run:
+            fields = get_form_parser(key='label').parse(event.get('body'))
+            check_cancelled(cancel_event, 'processing')
+            log.info("#%d: would process %r", issue_number, fields.get('content_name', 'Unnamed'))
+            return
+        processor = ContributionProcessor(github_token, issue_number, repo=repo, commit_trees=commit_trees,
+                                          body=event.get('body'), cancel_event=cancel_event)
+        processor.process()
+    
+    queue = CoalescingQueue(run, window=window, max_workers=workers)
+    for event in read_event_feed(feed, speed):
+        if event.get('action', 'edited') in ('opened', 'edited'):
+            queue.submit(int(event['issue']), event)
+    results = queue.close()
+    
+    for result in results:
+        suffix = f" - {result['error']}" if result['error'] else ''
+        log.info("#%d: %s (%d events coalesced)%s", result['key'], result['status'], result['events'], suffix)
+    
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    return results
+
+def run_worker(github_token, spool_dir, poll_interval=2.0, once=False):
+    """
+    Long running worker processing contribution jobs from a directory spool.
+    
+    The GitHub client, repository, HTTP sessions, category registry, form
+    parser and commit tree cache are created once and stay warm across
+    jobs, so each job only pays for its own API calls. When an issue has
+    several queued jobs only the latest one is processed.
+    
+    :param github_token: GitHub authentication token
+    :param spool_dir: Spool directory, see spool.DirectorySpool
+    :param poll_interval: Seconds between checks of an empty spool
+    :param once: Exit once the spool is empty instead of waiting for jobs
+    :return: Number of failed jobs
+    """
+    spool = DirectorySpool(spool_dir)
+    recovered = spool.recover()
+    if recovered:
+        log.info("Recovered %d jobs left by a previous worker", recovered)
+    
+    repo = make_github(github_token).get_repo(os.environ.get('GITHUB_REPOSITORY'))
+    commit_trees = {}
+    download_cache = DownloadCache.from_environment()
+    get_registry()
+    get_form_parser(key='label')
+    failed = 0
+    
+    log.info("Worker ready, watching %s", spool_dir)
+    while True:
+        jobs = spool.claim()
+        if not jobs:
+            if once:
+                return failed
+            time.sleep(poll_interval)
+            continue
+        
+        latest = {}
+        for name, job in jobs:
+            issue_number = int(job['issue'])
+            if issue_number in latest:
+                superseded_name, superseded_job = latest[issue_number]
+                spool.complete(superseded_name, superseded_job, {'status': 'superseded'})
+            latest[issue_number] = (name, job)
+        
+        if len(commit_trees) > MAX_CACHED_COMMIT_TREES:
+            commit_trees.clear()
+        
+        for issue_number, (name, job) in latest.items():
+            started = time.monotonic()
+            try:
+                processor = ContributionProcessor(github_token, issue_number, repo=repo, commit_trees=commit_trees,
+                                                  body=job.get('body'), download_cache=download_cache)
+                pr = processor.process()
+                result = {'status': 'success', 'pull_request': pr.number if pr else None,
+                          'unchanged': processor.unchanged, 'skipped_files': processor.skipped_files}
+            except Exception as e:
+                result = {'status': 'failed', 'error': str(e)}
+                failed += 1
+            result['seconds'] = round(time.monotonic() - started, 3)
+            spool.complete(name, job, result, failed=result['status'] == 'failed')
+            log.info("#%d: %s in %ss", issue_number, result['status'], result['seconds'])
+
 def main():
+    parser = argparse.ArgumentParser(description='Process contribution issues into pull requests')
+    parser.add_argument('--issues', default=os.environ.get('ISSUE_NUMBERS', ''), help='Batch mode: issue numbers and ranges, e.g. "12,15,20-25"')
+    parser.add_argument('--label', default=os.environ.get('ISSUE_LABEL', ''), help='Batch mode: process every open issue with this label')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('BATCH_WORKERS', '4')), help='Batch mode: issues processed in parallel')
+    parser.add_argument('--report', default=os.environ.get('BATCH_REPORT', ''), help='Batch or feed mode: write a JSON report to this path')
+    parser.add_argument('--feed', default=os.environ.get('EVENT_FEED', ''), help='Feed mode: JSONL file of issue events to coalesce and process, or - for stdin')
+    parser.add_argument('--window', type=float, default=float(os.environ.get('COALESCE_WINDOW', '30')), help='Feed mode: seconds without new events before an issue is processed')
+    parser.add_argument('--speed', type=float, default=1.0, help='Feed mode: replay speed factor of the feed timestamps')
+    parser.add_argument('--dry-run', action='store_true', help='Feed mode: only parse the issue bodies, without touching GitHub')
+    parser.add_argument('--spool', default=os.environ.get('CONTRIBUTION_SPOOL', ''), help='Worker mode: spool directory to process jobs from')
+    parser.add_argument('--enqueue', type=int, metavar='ISSUE', help='Worker mode: add a job for this issue to the spool and exit')
+    parser.add_argument('--once', action='store_true', help='Worker mode: exit once the spool is empty')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Worker mode: seconds between checks of an empty spool')
+    parser.add_argument('--api-usage', default=os.environ.get('API_USAGE_LOG', ''), help='Append a JSON summary of the API requests of each run to this file')
+    parser.add_argument('--log-level', default=os.environ.get('LOG_LEVEL', 'INFO'), help='DEBUG, INFO, WARNING or ERROR')
+    parser.add_argument('--log-format', choices=('text', 'json'), default=os.environ.get('LOG_FORMAT', 'text'), help='text, or one JSON object per line')
+    parser.add_argument('--trace', default=os.environ.get('TRACE_FILE', ''), help='Write the timing spans of all runs to this Chrome trace JSON file on exit')
+    parser.add_argument('--profile', metavar='ISSUE', default=os.environ.get('PROFILE_ISSUE', ''), help='Capture cProfile and tracemalloc data of the run of this issue')
+    parser.add_argument('--profile-dir', default=os.environ.get('PROFILE_DIR', '.'), help='Directory for the --profile output')
+    args = parser.parse_args()
+    
+    configure_logging(args.log_level, args.log_format)
+    if args.api_usage:
+        configure_api_usage(args.api_usage)
+    if args.trace:
+        enable_tracing()
+        atexit.register(write_chrome_trace, args.trace)
+    if args.profile:
+        configure_profiling(args.profile, args.profile_dir)
+    
     github_token = os.environ.get('GITHUB_TOKEN')
     issue_number = os.environ.get('ISSUE_NUMBER')
     
+    if args.spool and args.enqueue:
+        name = DirectorySpool(args.spool).enqueue({'issue': args.enqueue, 'action': 'edited'})
+        log.info("Queued %s", name)
+        return
+    
+    if args.spool and github_token:
+        if run_worker(github_token, args.spool, args.poll_interval, args.once):
+            sys.exit(1)
+        return
+    
+    if args.feed and (github_token or args.dry_run):
+        results = run_feed(github_token, args.feed, args.window, args.workers, args.speed, args.dry_run, args.report or None)
+        if any(result['status'] == 'failed' for result in results):
+            sys.exit(1)
+        return
+    
+    if github_token and (args.issues or args.label):
+        report = run_batch(github_token, parse_issue_numbers(args.issues), args.label or None, args.workers, args.report or None)
+        if any(result['status'] != 'success' for result in report):
+            sys.exit(1)
+        return
+    
     if not github_token or not issue_number:
-        print("Missing GitHub Token or Issue Number")
+        log.error("Missing GitHub Token or Issue Number")
         return
     
     processor = ContributionProcessor(github_token, int(issue_number))
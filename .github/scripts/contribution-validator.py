@@ -1,105 +1,423 @@
 # contribution-validator.py
 import os
+import sys
 import json
-import jsonschema
-import yaml
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from category_registry import CATEGORIES_PATH, CategoryRegistry, get_registry
+from manifest_schema import MANIFEST_SCHEMA, load_validator
+
+# Directories that hold contributions, each contribution has a manifest.json
+CONTRIBUTION_ROOTS = ['ai-character-chat', 'lore-books']
+
+# Bump when the cache format or the validation rules outside the schema change
+CACHE_VERSION = 1
+DEFAULT_CACHE_PATH = '.validation-cache.json'
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Code that decides validation results, repository paths. A change to any of them invalidates
+# cached results and makes --since validate everything.
+VALIDATOR_SOURCES = [
+    '.github/scripts/contribution-validator.py',
+    '.github/scripts/manifest_schema.py',
+    '.github/scripts/category_registry.py'
+]
+
+# Validator used by pool workers, created once per worker process
+_worker_validator = None
 
 class ContributionValidator:
-    def __init__(self, contribution_path):
+    def __init__(self, contribution_path, categories_path=CATEGORIES_PATH):
         """
         Initialize validator with contribution path.
-        
+
         :param contribution_path: Path to the contribution files
+        :param categories_path: Path of categories.json
         """
         self.contribution_path = contribution_path
-        self.categories = self.load_categories()
+        self.categories = self.load_categories(categories_path)
+        # Generated from MANIFEST_SCHEMA ahead of time, reports the same errors as jsonschema
+        self.iter_schema_errors = load_validator(MANIFEST_SCHEMA)
 
-    def load_categories(self):
+    def load_categories(self, categories_path=CATEGORIES_PATH):
         """
         Load available categories from categories.json.
-        
-        :return: Dictionary of available categories
+
+        :param categories_path: Path of categories.json
+        :return: CategoryRegistry of available categories
         """
-        with open('categories.json', 'r') as f:
-            return json.load(f)
+        return get_registry(categories_path)
 
-    def validate_manifest_schema(self, manifest_path):
+    def load_manifest(self, manifest_path):
         """
-        Validate manifest against a predefined schema.
-        
+        Read and parse a manifest.json.
+
         :param manifest_path: Path to manifest.json
-        :return: Boolean indicating validation result
+        :return: Parsed manifest
         """
-        # TODO: Define comprehensive JSON schema
-        schema = {
-            "type": "object",
-            "required": ["name", "description", "author"],
-            "properties": {
-                "name": {"type": "string"},
-                "description": {"type": "string"},
-                "author": {"type": "string"}
-            }
-        }
-
         with open(manifest_path, 'r') as f:
-            manifest = json.load(f)
+            return json.load(f)
 
-        try:
-            jsonschema.validate(instance=manifest, schema=schema)
-            return True
-        except jsonschema.exceptions.ValidationError as e:
-            print(f"Manifest validation error: {e}")
-            return False
+    def schema_errors(self, manifest):
+        """
+        Validate manifest against the manifest schema.
 
-    def validate_categories(self, manifest_path):
+        :param manifest: Parsed manifest
+        :return: List of error messages
+        """
+        errors = []
+        for error in sorted(self.iter_schema_errors(manifest), key=lambda e: [str(part) for part in e.path]):
+            location = '/'.join(str(part) for part in error.path)
+            errors.append(f"{location}: {error.message}" if location else error.message)
+        return errors
+
+    def category_errors(self, manifest):
         """
         Check if categories in manifest match available categories.
-        
-        :param manifest_path: Path to manifest.json
-        :return: Boolean indicating category validation result
+
+        :param manifest: Parsed manifest
+        :return: List of error messages
         """
-        with open(manifest_path, 'r') as f:
-            manifest = json.load(f)
-        
         categories = manifest.get('categories', {})
-        
+        rating = categories.get('rating')
+        errors = []
+
         for category_type, values in categories.items():
             if not isinstance(values, list):
                 values = [values]
-            
+
             # Check if all category values are valid
-            available_categories = self.categories.get(category_type, [])
             for value in values:
-                if value not in available_categories:
-                    print(f"Invalid category: {value} for type {category_type}")
-                    return False
-        
-        return True
+                if not self.categories.is_valid(category_type, value, rating):
+                    errors.append(f"Invalid category: {value} for type {category_type}")
+
+        return errors
+
+    def validate_manifest_schema(self, manifest):
+        """
+        Validate manifest against a predefined schema.
+
+        :param manifest: Parsed manifest
+        :return: Boolean indicating validation result
+        """
+        errors = self.schema_errors(manifest)
+        for error in errors:
+            print(f"Manifest validation error: {error}")
+        return not errors
+
+    def validate_categories(self, manifest):
+        """
+        Check if categories in manifest match available categories.
+
+        :param manifest: Parsed manifest
+        :return: Boolean indicating category validation result
+        """
+        errors = self.category_errors(manifest)
+        for error in errors:
+            print(error)
+        return not errors
 
     def validate_contribution(self):
         """
         Perform comprehensive validation of the contribution.
-        
+
         :return: Boolean indicating overall validation result
         """
         manifest_path = os.path.join(self.contribution_path, 'manifest.json')
-        
+
         if not os.path.exists(manifest_path):
             print("Manifest file not found on:" + manifest_path)
             return False
-        
-        manifest_valid = self.validate_manifest_schema(manifest_path)
-        categories_valid = self.validate_categories(manifest_path)
-        
+
+        manifest = self.load_manifest(manifest_path)
+        manifest_valid = self.validate_manifest_schema(manifest)
+        categories_valid = self.validate_categories(manifest)
+
         return manifest_valid and categories_valid
 
+    def check_manifest(self, manifest_path):
+        """
+        Validate one manifest file and collect every error.
+
+        :param manifest_path: Path to manifest.json
+        :return: Result dictionary with path, valid, errors, manifest_hash and the categories it uses
+        """
+        try:
+            with open(manifest_path, 'rb') as f:
+                raw = f.read()
+            manifest = json.loads(raw)
+        except (OSError, ValueError) as e:
+            return {'path': manifest_path, 'valid': False, 'errors': [f"Unreadable manifest: {e}"], 'manifest_hash': None, 'categories': []}
+
+        errors = self.schema_errors(manifest) + self.category_errors(manifest)
+        categories = manifest.get('categories', {})
+        return {
+            'path': manifest_path,
+            'valid': not errors,
+            'errors': errors,
+            'manifest_hash': hashlib.sha256(raw).hexdigest(),
+            'categories': sorted(categories) if isinstance(categories, dict) else []
+        }
+
+def discover_manifests(root='.'):
+    """
+    Find every contribution manifest in the repository.
+
+    :param root: Repository root
+    :return: Sorted list of manifest paths relative to root
+    """
+    manifests = []
+    for contribution_root in CONTRIBUTION_ROOTS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, contribution_root)):
+            if 'manifest.json' in filenames:
+                manifests.append(os.path.relpath(os.path.join(dirpath, 'manifest.json'), root))
+    return sorted(manifests)
+
+def file_hash(path):
+    """
+    Get the SHA-256 of a file.
+
+    :param path: File path
+    :return: Hex digest, or None if the file cannot be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def validator_hash():
+    """
+    Get a hash of the manifest schema and the validator sources, cached results are only valid for the same ones.
+
+    :return: Hex digest
+    """
+    digest = hashlib.sha256(json.dumps([CACHE_VERSION, MANIFEST_SCHEMA], sort_keys=True).encode('utf-8'))
+    for source in VALIDATOR_SOURCES:
+        digest.update(str(file_hash(os.path.join(SCRIPTS_DIR, os.path.basename(source)))).encode('utf-8'))
+    return digest.hexdigest()
+
+def changed_since(ref, root='.'):
+    """
+    List files changed between a git ref and the working tree.
+
+    :param ref: Git ref to compare against
+    :param root: Repository root
+    :return: Set of changed paths relative to root, or None if git could not compare
+    """
+    try:
+        output = subprocess.run(
+            ['git', 'diff', '--name-only', ref, '--'],
+            cwd=root, check=True, capture_output=True, text=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"WARNING: Cannot diff against {ref}, validating everything: {e}", file=sys.stderr)
+        return None
+    return {line.strip() for line in output.splitlines() if line.strip()}
+
+def changed_categories(ref, registry, root='.'):
+    """
+    Find the categories whose definition differs from categories.json at a git ref.
+
+    :param ref: Git ref to compare against
+    :param registry: Current CategoryRegistry
+    :param root: Repository root
+    :return: Set of lowercase category names
+    """
+    try:
+        output = subprocess.run(
+            ['git', 'show', f'{ref}:categories.json'],
+            cwd=root, check=True, capture_output=True, text=True
+        ).stdout
+        old_registry = CategoryRegistry(json.loads(output))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        # Unknown previous state, treat every category as changed
+        return set(registry.names)
+
+    names = set(registry.names) | set(old_registry.names)
+    return {name for name in names if registry.category_hash(name) != old_registry.category_hash(name)}
+
+def select_manifests(manifests, since, registry, root='.'):
+    """
+    Keep the manifests affected by changes since a git ref.
+
+    A manifest is affected when any file in its directory changed, or when
+    categories.json changed a category the manifest uses. Every manifest is
+    affected when the schema or the validator changed.
+
+    :param manifests: Manifest paths relative to root
+    :param since: Git ref
+    :param registry: Current CategoryRegistry
+    :param root: Repository root
+    :return: List of manifest paths
+    """
+    changed = changed_since(since, root)
+    if changed is None:
+        return manifests
+    if changed & set(VALIDATOR_SOURCES):
+        print("The validator changed, validating everything", file=sys.stderr)
+        return manifests
+
+    changed_dirs = {os.path.dirname(path) for path in changed}
+    affected_categories = changed_categories(since, registry, root) if 'categories.json' in changed else set()
+
+    selected = []
+    for manifest_path in manifests:
+        manifest_dir = os.path.dirname(manifest_path)
+        # Files in sub-directories (e.g. src/) belong to the manifest too
+        if any(path == manifest_dir or path.startswith(manifest_dir + '/') for path in changed_dirs):
+            selected.append(manifest_path)
+        elif affected_categories:
+            try:
+                with open(os.path.join(root, manifest_path), 'r') as f:
+                    used = {name.lower() for name in json.load(f).get('categories', {})}
+            except (OSError, ValueError):
+                used = affected_categories
+            if used & affected_categories:
+                selected.append(manifest_path)
+    return selected
+
+def load_cache(cache_path):
+    """
+    Load the validation result cache, discarding it if the schema or the validator changed.
+
+    :param cache_path: Path to the cache file
+    :return: Dictionary of manifest path -> cached result
+    """
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('validator_hash') != validator_hash():
+        return {}
+    return cache.get('entries', {})
+
+def save_cache(cache_path, entries):
+    """
+    Write the validation result cache.
+
+    :param cache_path: Path to the cache file
+    :param entries: Dictionary of manifest path -> cached result
+    """
+    with open(cache_path, 'w') as f:
+        json.dump({'validator_hash': validator_hash(), 'entries': entries}, f, indent=1, sort_keys=True)
+
+def cache_is_fresh(entry, manifest_hash, registry):
+    """
+    Check whether a cached result still applies.
+
+    :param entry: Cached entry with manifest_hash, category_hashes and result
+    :param manifest_hash: Current hash of the manifest
+    :param registry: Current CategoryRegistry
+    :return: Boolean
+    """
+    if entry.get('manifest_hash') != manifest_hash:
+        return False
+    # Only the categories this manifest uses matter, other edits to categories.json keep the entry
+    return all(registry.category_hash(name) == category_hash for name, category_hash in entry.get('category_hashes', {}).items())
+
+def _init_worker(categories_path):
+    """
+    Create the validator of a pool worker, so schema and categories are compiled once per process.
+
+    :param categories_path: Path of the categories.json being validated against
+    """
+    global _worker_validator
+    _worker_validator = ContributionValidator(None, categories_path)
+
+def _check_manifest(manifest_path):
+    return _worker_validator.check_manifest(manifest_path)
+
+def validate_repository(root='.', workers=None, since=None, cache_path=None):
+    """
+    Validate the manifests of the repository on a process pool.
+
+    :param root: Repository root
+    :param workers: Number of worker processes, defaults to the CPU count
+    :param since: Only validate manifests affected by changes since this git ref
+    :param cache_path: Reuse results of unchanged manifests from this cache file
+    :return: Report dictionary with totals and per-manifest results
+    """
+    categories_path = os.path.join(root, 'categories.json')
+    registry = get_registry(categories_path)
+    discovered = discover_manifests(root)
+    manifests = discovered
+    if since:
+        manifests = select_manifests(discovered, since, registry, root)
+
+    cache = load_cache(cache_path) if cache_path else {}
+    results = {}
+    pending = []
+    for manifest_path in manifests:
+        entry = cache.get(manifest_path)
+        if entry and cache_is_fresh(entry, file_hash(os.path.join(root, manifest_path)), registry):
+            results[manifest_path] = dict(entry['result'], cached=True)
+        else:
+            pending.append(manifest_path)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pending) < 2:
+        _init_worker(categories_path)
+        checked = [_check_manifest(os.path.join(root, path)) for path in pending]
+    else:
+        # Big chunks keep the inter-process overhead small next to the validation work
+        chunksize = max(1, len(pending) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(categories_path,)) as executor:
+            checked = list(executor.map(_check_manifest, [os.path.join(root, path) for path in pending], chunksize=chunksize))
+
+    for result in checked:
+        result['path'] = os.path.relpath(result['path'], root)
+        results[result['path']] = result
+        if cache_path and result['manifest_hash']:
+            cache[result['path']] = {
+                'manifest_hash': result['manifest_hash'],
+                'category_hashes': {name: registry.category_hash(name) for name in result['categories']},
+                'result': result
+            }
+
+    if cache_path:
+        # Drop entries of deleted or renamed manifests; with --since the unselected ones still exist and stay
+        existing = set(discovered)
+        save_cache(cache_path, {path: entry for path, entry in cache.items() if path in existing})
+
+    ordered = [results[path] for path in sorted(results)]
+    invalid = sum(1 for result in ordered if not result['valid'])
+    return {
+        'total': len(ordered),
+        'valid': len(ordered) - invalid,
+        'invalid': invalid,
+        'cached': len(ordered) - len(checked),
+        'results': ordered
+    }
+
 def main():
+    parser = argparse.ArgumentParser(description='Validate contribution manifests')
+    parser.add_argument('--all', action='store_true', help='Validate every manifest in the repository')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --all (default: CPU count)')
+    parser.add_argument('--report', default=None, help='Write the --all JSON report to this file instead of stdout')
+    parser.add_argument('--since', default=None, help='With --all, only validate manifests affected by changes since this git ref')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_PATH, default=None, help=f'With --all, reuse results of unchanged manifests (default file: {DEFAULT_CACHE_PATH})')
+    args = parser.parse_args()
+
+    if args.all:
+        report = validate_repository('.', args.workers, args.since, args.cache)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Validated {report['total']} manifests ({report['cached']} from cache): {report['invalid']} invalid")
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        exit(0 if report['invalid'] == 0 else 1)
+
     # TODO: Update to detect contribution type and path dynamically
     contribution_path = os.environ.get('CONTRIBUTION_PATH', '.')
-    
+
     validator = ContributionValidator(contribution_path)
     validation_result = validator.validate_contribution()
-    
+
     # Exit with appropriate status code
     exit(0 if validation_result else 1)
 
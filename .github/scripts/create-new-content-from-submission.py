@@ -8,97 +8,20 @@ from pathlib import Path
 from slugify import slugify
 from datetime import datetime, timezone
 import requests
+from category_registry import get_registry
+from issue_form import get_form_parser
+
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
 
 def parse_issue_body(issue_body):
     """
-    Parse the GitHub issue body, extracting only specific fields
+    Parse the GitHub issue body into fields keyed by their issue form id
     """
-    # Load categories dynamically from categories.json
-    with open('categories.json', 'r') as f:
-        categories_data = json.load(f)
-    
-    # Generate list of category field names dynamically
-    category_fields = [
-        category['name'].lower() 
-        for category in categories_data 
-        if not category.get('nsfw_only', False)
-    ]
-    
-    # Fields to ignore during parsing
-    ignore_fields = ['readme', 'custom-code', 'lorebook']
-    
-    # Initialize parsed data dictionary
-    parsed_data = {}
-    
-    # Split issue body into lines
-    lines = issue_body.split('\n')
-    
-    # Current field being processed
-    current_field = None
-    
-    # Improved README parsing
-    readme_start = issue_body.find('### README Content')
-    readme_end = issue_body.find('### Content Rating (REQUIRED)', readme_start)
-    
-    if readme_start != -1 and readme_end != -1:
-        # Extract README content
-        readme_content = issue_body[readme_start:readme_end].split('\n', 2)[-1].strip()
-        
-        # Remove HTML tags
-        readme_content = re.sub(r'<[^>]+>', '', readme_content)
-        
-        parsed_data['readme'] = readme_content
+    parsed_data = get_form_parser(key='id').parse(issue_body)
     
-    for line in lines:
-        # Remove markdown formatting
-        line = line.strip()
-
-        # Skip empty lines and markdown headers
-        if not line or line.startswith('##') or line.startswith('<'):
-            continue
-        
-        # Check for field identifiers
-        field_match = re.match(r'^### (.+)$', line)
-        if field_match:
-            current_field = slugify(field_match.group(1).lower(), separator='_')
-
-            # Special handling for specific fields
-            if current_field == 'content_type':
-                current_field = 'content-type'
-            elif current_field == 'content_rating':
-                current_field = 'rating'
-
-            # Reset current_field if it's in ignore list or a category
-            if current_field in ignore_fields or current_field in category_fields:
-                parsed_data[current_field] = []
-                continue
-            
-            # Reset current field if not a valid identifier
-            if current_field not in parsed_data:
-                parsed_data[current_field] = line.split(':', 1)[-1].strip()
-        
-        # For category fields, collect multiple values
-        elif current_field in category_fields and line and line != '_No response_':
-            # Remove list markers and extra whitespace
-            cleaned_line = line.lstrip('- ').strip()
-            if cleaned_line:
-                if not isinstance(parsed_data[current_field], list):
-                    parsed_data[current_field] = []
-                parsed_data[current_field].append(cleaned_line)
-        
-        # For readme, custom-code, and lorebook, store the raw content
-        elif current_field in ignore_fields:
-            # For these fields, store raw content
-            if current_field not in parsed_data:
-                parsed_data[current_field] = line
-            else:
-                parsed_data[current_field] += '\n' + line
-
-    # Final processing for ignore_fields
-    for field in ignore_fields:
-        # Remove code block markers if present
-        if field in parsed_data:
-            parsed_data[field] = re.sub(r'```.*?\n', '', parsed_data[field], flags=re.DOTALL).strip()
+    # Remove HTML tags from the README
+    if parsed_data.get('readme'):
+        parsed_data['readme'] = HTML_TAG_PATTERN.sub('', parsed_data['readme'])
     
     return parsed_data
 
@@ -114,11 +37,10 @@ def validate_categories(content_type, rating, categories):
     """
     Validate categories against categories.json
     """
-    with open('categories.json', 'r') as f:
-        valid_categories = json.load(f)
+    registry = get_registry()
     
     validated_categories = {}
-    for category_def in valid_categories:
+    for category_def in registry.categories:
         category_name = category_def['name'].lower()
         
         # Get submitted values for this category
@@ -132,17 +54,15 @@ def validate_categories(content_type, rating, categories):
         if category_def.get('nsfw_only', False) and rating == 'sfw':
             continue
         
-        # Validate submitted values
-        valid_tags = category_def['tags'].get('general', []) + (
-            category_def['tags'].get('nsfw', []) if rating == 'nsfw' else []
-        )
+        # Validate submitted values, matching tags case-insensitively
+        canonical_values = [registry.canonical_tag(category_name, value, rating) for value in submitted_values]
         
         # Ensure all submitted values are valid
-        invalid_values = set(submitted_values) - set(valid_tags)
+        invalid_values = {value for value, canonical in zip(submitted_values, canonical_values) if canonical is None}
         if invalid_values:
             raise ValueError(f"Invalid {category_name} categories: {invalid_values}")
         
-        validated_categories[category_name] = submitted_values
+        validated_categories[category_name] = canonical_values
     
     return validated_categories
 
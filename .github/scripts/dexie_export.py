@@ -0,0 +1,117 @@
+# dexie_export.py
+# Streams a single character into a gzipped chatbot-ui Dexie export (character.gz)
+import io
+import gzip
+import json
+
+DATABASE_NAME = "chatbot-ui-v1"
+DATABASE_VERSION = 90
+
+# Table name -> Dexie schema, in export order. Only "characters" has a row.
+TABLE_SCHEMAS = [
+    ("characters", "++id,modelName,fitMessagesInContextMethod,uuid,creationTime,lastMessageTime"),
+    ("threads", "++id,name,characterId,creationTime,lastMessageTime,lastViewTime"),
+    ("messages", "++id,threadId,characterId,creationTime,order"),
+    ("misc", "key"),
+    ("summaries", "hash,threadId"),
+    ("memories", "++id,[summaryHash+threadId],[characterId+status],[threadId+status],[threadId+index],threadId"),
+    ("lore", "++id,bookId,bookUrl"),
+    ("textEmbeddingCache", "++id,textHash,&[textHash+modelName]"),
+    ("textCompressionCache", "++id,uncompressedTextHash,&[uncompressedTextHash+modelName+tokenLimit]"),
+    ("usageStats", "[dateHour+threadId+modelName],threadId,characterId,dateHour"),
+]
+
+# Type hints the importer needs to restore non-JSON values of a character row
+CHARACTER_TYPES = {
+    "maxParagraphCountPerMessage": "undef",
+    "initialMessages": "arrayNonindexKeys",
+    "shortcutButtons": "arrayNonindexKeys",
+    "loreBookUrls": "arrayNonindexKeys"
+}
+
+_ROW_PLACEHOLDER = "__CHARACTER_ROW__"
+_SEPARATORS = (",", ":")
+
+
+def _build_envelope():
+    """
+    Serialize the fixed part of the export once, split around the character row.
+
+    :return: Tuple of (prefix bytes, suffix bytes)
+    """
+    export_data = {
+        "formatName": "dexie",
+        "formatVersion": 1,
+        "data": {
+            "databaseName": DATABASE_NAME,
+            "databaseVersion": DATABASE_VERSION,
+            "tables": [
+                {"name": name, "schema": schema, "rowCount": 1 if name == "characters" else 0}
+                for name, schema in TABLE_SCHEMAS
+            ],
+            "data": [
+                {"tableName": name, "inbound": True, "rows": [_ROW_PLACEHOLDER] if name == "characters" else []}
+                for name, schema in TABLE_SCHEMAS
+            ]
+        }
+    }
+
+    prefix, suffix = json.dumps(export_data, separators=_SEPARATORS).split(json.dumps(_ROW_PLACEHOLDER))
+    return prefix.encode("utf-8"), suffix.encode("utf-8")
+
+
+EXPORT_PREFIX, EXPORT_SUFFIX = _build_envelope()
+
+
+def character_row(character_info, created_ms):
+    """
+    Build the characters table row for the export.
+
+    :param character_info: Character data from the Perchance share file
+    :param created_ms: Creation time in milliseconds since the epoch
+    :return: Row dictionary
+    """
+    return {
+        **character_info,
+        "id": 1,
+        "creationTime": created_ms,
+        "lastMessageTime": created_ms,
+        "$types": dict(CHARACTER_TYPES)
+    }
+
+
+def write_character_export(fileobj, row, compresslevel=9, mtime=0):
+    """
+    Write a gzipped Dexie export containing one character row.
+
+    The envelope is written from precomputed bytes and the row is encoded
+    compactly straight into the gzip stream, so the full export is never
+    held in memory as one string.
+
+    :param fileobj: Binary file object to write the gzip stream to
+    :param row: Character row, see character_row()
+    :param compresslevel: gzip compression level, 0-9
+    :param mtime: Timestamp stored in the gzip header, fixed for reproducible output
+    """
+    with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=compresslevel, mtime=mtime) as gz_file:
+        gz_file.write(EXPORT_PREFIX)
+
+        text = io.TextIOWrapper(gz_file, encoding="utf-8")
+        json.dump(row, text, separators=_SEPARATORS)
+        text.flush()
+        text.detach()
+
+        gz_file.write(EXPORT_SUFFIX)
+
+
+def build_character_export(row, compresslevel=9):
+    """
+    Build character.gz content in memory.
+
+    :param row: Character row, see character_row()
+    :param compresslevel: gzip compression level, 0-9
+    :return: gzip bytes
+    """
+    buffer = io.BytesIO()
+    write_character_export(buffer, row, compresslevel)
+    return buffer.getvalue()
@@ -0,0 +1,243 @@
+# download_cache.py
+# On-disk, size-bounded LRU cache for Perchance share files, keyed by file id
+import os
+import re
+import zlib
+import logging
+import tempfile
+
+DEFAULT_BASE_URL = "https://user-uploads.perchance.org/file"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "perchance-files")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_FILE_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_DECOMPRESSED_BYTES = 128 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+# File ids are hex hashes with an extension, anything else could escape the cache directory
+FILE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_\-]+\.[A-Za-z0-9]+$')
+
+
+class FileTooLargeError(ValueError):
+    """
+    Raised when a download or its decompressed content exceeds the configured limit.
+    """
+
+
+class DownloadCache:
+    """
+    Cache of downloaded share files.
+
+    Share file ids are content-addressed, so a cached file never needs to be
+    revalidated. The least recently used files are evicted once the cache
+    grows over its size limit.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, base_url=DEFAULT_BASE_URL,
+                 max_file_bytes=DEFAULT_MAX_FILE_BYTES, max_decompressed_bytes=DEFAULT_MAX_DECOMPRESSED_BYTES):
+        """
+        :param cache_dir: Directory holding cached files
+        :param max_bytes: Maximum total size of the cache
+        :param base_url: URL files are downloaded from, without trailing slash
+        :param max_file_bytes: Maximum size of a single downloaded file
+        :param max_decompressed_bytes: Maximum size of a file once decompressed
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.base_url = base_url.rstrip('/')
+        self.max_file_bytes = max_file_bytes
+        self.max_decompressed_bytes = max_decompressed_bytes
+        # Created on the first download, keeps connections alive across downloads
+        self._session = None
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a cache configured by PERCHANCE_CACHE_DIR, PERCHANCE_CACHE_MAX_BYTES,
+        PERCHANCE_FILE_BASE_URL, PERCHANCE_MAX_FILE_BYTES and
+        PERCHANCE_MAX_DECOMPRESSED_BYTES.
+
+        :return: DownloadCache instance
+        """
+        return cls(
+            cache_dir=os.environ.get('PERCHANCE_CACHE_DIR') or DEFAULT_CACHE_DIR,
+            max_bytes=int(os.environ.get('PERCHANCE_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES),
+            base_url=os.environ.get('PERCHANCE_FILE_BASE_URL') or DEFAULT_BASE_URL,
+            max_file_bytes=int(os.environ.get('PERCHANCE_MAX_FILE_BYTES') or DEFAULT_MAX_FILE_BYTES),
+            max_decompressed_bytes=int(os.environ.get('PERCHANCE_MAX_DECOMPRESSED_BYTES') or DEFAULT_MAX_DECOMPRESSED_BYTES)
+        )
+
+    def path_for(self, file_id):
+        """
+        Get the cache path of a file id.
+
+        :param file_id: Share file id, e.g. "462d8d1f91b3febeaa3e0dfb676cadfc.gz"
+        :return: Absolute path inside the cache directory
+        """
+        if not FILE_ID_PATTERN.match(file_id):
+            raise ValueError(f"Invalid share file id: {file_id}")
+        return os.path.join(self.cache_dir, file_id)
+
+    def get(self, file_id):
+        """
+        Look a file up in the cache and mark it as recently used.
+
+        :param file_id: Share file id
+        :return: Path of the cached file, or None if not cached
+        """
+        path = self.path_for(file_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _write(self, file_id, chunks):
+        """
+        Stream chunks into the cache, then evict old files if over the size limit.
+
+        :param file_id: Share file id
+        :param chunks: Iterable of bytes
+        :return: Path of the cached file
+        """
+        path = self.path_for(file_id)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise FileTooLargeError(f"Share file {file_id} is larger than {self.max_file_bytes} bytes")
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.evict()
+        return path
+
+    def discard(self, file_id):
+        """
+        Remove a file from the cache, e.g. one that turned out to be corrupt.
+
+        :param file_id: Share file id
+        :return: True if a file was removed
+        """
+        try:
+            os.unlink(self.path_for(file_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, file_id, data):
+        """
+        Store a file in the cache.
+
+        :param file_id: Share file id
+        :param data: File content as bytes
+        :return: Path of the cached file
+        """
+        return self._write(file_id, [data])
+
+    def evict(self):
+        """
+        Remove least recently used files until the cache fits its size limit.
+
+        :return: Number of files removed
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.is_file() and not entry.name.startswith('.tmp-')]
+        except FileNotFoundError:
+            return 0
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+
+        removed = 0
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+
+        return removed
+
+    def fetch(self, file_id, timeout=15):
+        """
+        Get a share file, streaming it to disk only if it is not cached.
+
+        :param file_id: Share file id
+        :param timeout: Download timeout in seconds
+        :return: Path of the cached file
+        """
+        path = self.get(file_id)
+        if path is not None:
+            log.debug("Using cached share file %s", file_id)
+            return path
+
+        if self._session is None:
+            # requests is only needed on a cache miss
+            import requests
+            self._session = requests.Session()
+
+        with self._session.get(f"{self.base_url}/{file_id}", timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+
+            # Refuse early when the server announces an oversized file
+            content_length = response.headers.get('Content-Length')
+            if content_length and int(content_length) > self.max_file_bytes:
+                raise FileTooLargeError(f"Share file {file_id} is {content_length} bytes, limit is {self.max_file_bytes}")
+
+            return self._write(file_id, response.iter_content(chunk_size=CHUNK_SIZE))
+
+    def read_gzip(self, path):
+        """
+        Decompress a gzip file in chunks, enforcing the decompressed size limit.
+
+        Decompression stops as soon as the limit is crossed, so gzip bombs
+        fail without ever being fully inflated.
+
+        :param path: Path of the gzip file
+        :return: Decompressed content as a bytearray, not copied into bytes to keep the peak memory at the limit
+        """
+        output = bytearray()
+        # 16 + MAX_WBITS: expect a gzip header and trailer
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        in_member = False
+
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                while chunk:
+                    in_member = True
+                    remaining = self.max_decompressed_bytes - len(output)
+                    output += decompressor.decompress(chunk, remaining + 1)
+                    if len(output) > self.max_decompressed_bytes:
+                        raise FileTooLargeError(f"{os.path.basename(path)} decompresses to more than {self.max_decompressed_bytes} bytes")
+
+                    if decompressor.eof:
+                        # Concatenated gzip members are valid gzip, continue with the next one
+                        chunk = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        in_member = False
+                    else:
+                        chunk = decompressor.unconsumed_tail
+
+        if in_member:
+            raise ValueError(f"{os.path.basename(path)} is truncated")
+
+        return output
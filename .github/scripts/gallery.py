@@ -0,0 +1,292 @@
+# gallery.py
+# Read-optimized gallery artifacts: summary pages, tag index and ranked views generated from index.json
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+
+from character_index import CHARACTERS_DIR, INDEX_PATH, read_published_index
+from tag_index import build_tag_index, render_tag_index
+from rankings import STATE_PATH as RANKINGS_STATE_PATH, ranked_views
+from github_client import git_blob_sha, make_github, retry_pause
+
+GALLERY_DIR = f"{CHARACTERS_DIR}/gallery"
+PAGES_DIR = f"{GALLERY_DIR}/pages"
+TAGS_DIR = f"{GALLERY_DIR}/tags"
+RANKINGS_DIR = f"{GALLERY_DIR}/rankings"
+# Entry point of the gallery, the only file clients fetch without a content hash
+GALLERY_INDEX = f"{GALLERY_DIR}/gallery.json"
+GALLERY_VERSION = 1
+DEFAULT_PAGE_SIZE = 100
+# Full manifests are loaded lazily from the index fragments, relative to CHARACTERS_DIR
+MANIFEST_PATTERN = "index.d/{path}.json"
+# Manifest counters, stored in this order as the "counters" list of a record
+COUNTERS = ("shapeShifter_Pulls", "galleryChat_Clicks", "galleryDownload_Clicks")
+
+_SEPARATORS = (",", ":")
+
+
+def _tag_list(value):
+    """
+    Normalize a category value to a list of tags.
+
+    :param value: List of tags, or a legacy comma separated string
+    :return: List of tags
+    """
+    if isinstance(value, list):
+        return value
+    return [tag.strip() for tag in str(value or "").split(",") if tag.strip()]
+
+
+def summary_record(entry):
+    """
+    Build the compact record a gallery card needs.
+
+    :param entry: Index entry with path and manifest
+    :return: Summary dictionary
+    """
+    manifest = entry["manifest"]
+    categories = manifest.get("categories", {})
+
+    return {
+        "path": entry["path"],
+        "name": manifest.get("name", ""),
+        "author": manifest.get("author", ""),
+        # Older entries store the image as characterAvatar
+        "image": manifest.get("imageUrl") or manifest.get("characterAvatar", ""),
+        "rating": categories.get("rating", ""),
+        "tags": {
+            name: tags
+            for name, tags in ((name, _tag_list(value)) for name, value in categories.items() if name != "rating")
+            if tags
+        },
+        "counters": [manifest.get(counter, 0) for counter in COUNTERS]
+    }
+
+
+def render_page(records):
+    """
+    Serialize a page of summary records compactly.
+
+    :param records: List of summary dictionaries
+    :return: JSON string
+    """
+    return json.dumps(records, separators=_SEPARATORS, ensure_ascii=False)
+
+
+def content_filename(content):
+    """
+    Name a generated file after its content, so unchanged files keep their URL and stay cacheable.
+
+    :param content: JSON string
+    :return: File name, e.g. "3f2a9c0d1e4b5a6c.json"
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16] + ".json"
+
+
+def build_pages(entries, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Split the index into fixed-size pages of summary records, ordered by path.
+
+    Adding or removing a character only rewrites the pages from its
+    position on, earlier pages keep their content hash.
+
+    :param entries: Index entries
+    :param page_size: Records per page
+    :return: List of (file name, content, record count)
+    """
+    records = [summary_record(entry) for entry in sorted(entries, key=lambda entry: entry["path"])]
+
+    pages = []
+    for start in range(0, len(records), page_size):
+        page = records[start:start + page_size]
+        content = render_page(page)
+        pages.append((content_filename(content), content, len(page)))
+    return pages
+
+
+def render_gallery_index(pages, page_size, tag_index_file, rankings_file):
+    """
+    Serialize the gallery entry point listing the pages in order.
+
+    :param pages: List of (file name, content, record count), see build_pages()
+    :param page_size: Records per page
+    :param tag_index_file: File name of the tag index
+    :param rankings_file: File name of the ranked views
+    :return: JSON string
+    """
+    gallery = {
+        "version": GALLERY_VERSION,
+        "pageSize": page_size,
+        "total": sum(count for _, _, count in pages),
+        "manifest": MANIFEST_PATTERN,
+        "counters": list(COUNTERS),
+        # Character IDs of the tag index are positions in the pages, page = ID // pageSize
+        "tags": f"tags/{tag_index_file}",
+        "rankings": f"rankings/{rankings_file}",
+        "pages": [{"file": f"pages/{filename}", "count": count} for filename, _, count in pages]
+    }
+    return json.dumps(gallery, indent=2) + "\n"
+
+
+def gallery_files(entries, page_size=DEFAULT_PAGE_SIZE, registry=None, rankings_state=None, now=None):
+    """
+    Generate every gallery file from the index entries.
+
+    :param entries: Index entries
+    :param page_size: Records per page
+    :param registry: CategoryRegistry for the tag index, defaults to the one of categories.json
+    :param rankings_state: Current content of rankings-state.json, or None
+    :param now: Current time in seconds since the epoch, for the trending scores
+    :return: Dictionary of repository path -> content, including the updated rankings state
+    """
+    ordered = sorted(entries, key=lambda entry: entry["path"])
+    pages = build_pages(ordered, page_size)
+
+    tag_index = render_tag_index(build_tag_index([entry["manifest"] for entry in ordered], registry), len(ordered))
+    tag_index_file = content_filename(tag_index)
+
+    rankings, rankings_state = ranked_views(ordered, rankings_state, time.time() if now is None else now, registry)
+    rankings_file = content_filename(rankings)
+
+    files = {f"{PAGES_DIR}/{filename}": content for filename, content, _ in pages}
+    files[f"{TAGS_DIR}/{tag_index_file}"] = tag_index
+    files[f"{RANKINGS_DIR}/{rankings_file}"] = rankings
+    files[GALLERY_INDEX] = render_gallery_index(pages, page_size, tag_index_file, rankings_file)
+    files[RANKINGS_STATE_PATH] = rankings_state
+    return files
+
+
+def build_gallery(root=".", page_size=DEFAULT_PAGE_SIZE):
+    """
+    Generate the gallery artifacts from index.json.
+
+    Files whose content did not change are left untouched and files no
+    longer generated are removed.
+
+    :param root: Repository root
+    :param page_size: Records per page
+    :return: True if any gallery file changed
+    """
+    with open(os.path.join(root, INDEX_PATH), "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    rankings_state = None
+    state_file = os.path.join(root, RANKINGS_STATE_PATH)
+    if os.path.exists(state_file):
+        with open(state_file, "r", encoding="utf-8") as f:
+            rankings_state = f.read()
+
+    files = gallery_files(entries, page_size, rankings_state=rankings_state)
+
+    changed = False
+    for path, content in files.items():
+        file_path = os.path.join(root, path)
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    continue
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        changed = True
+
+    for dirpath, _, filenames in os.walk(os.path.join(root, GALLERY_DIR)):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            if os.path.relpath(file_path, root).replace(os.sep, "/") not in files:
+                os.remove(file_path)
+                changed = True
+
+    print(f"Gallery: {len(files)} files, {'updated' if changed else 'up to date'}")
+    return changed
+
+
+def publish_gallery(repo, branch="main", page_size=DEFAULT_PAGE_SIZE, max_retries=5):
+    """
+    Generate the gallery from the published index.json and commit it through the GitHub API.
+
+    New and removed pages, the tag index, the ranked views with their state
+    and gallery.json go up as a single commit. The branch is moved without
+    force, so if it moved in the meantime the gallery is generated again on
+    top of the new head.
+
+    :param repo: PyGithub repository
+    :param branch: Branch to publish to
+    :param page_size: Records per page
+    :param max_retries: Number of retries after the branch moved
+    :return: True if a commit was made
+    """
+    from github import GithubException, InputGitTreeElement
+
+    for attempt in range(max_retries + 1):
+        ref = repo.get_git_ref(f"heads/{branch}")
+        parent = repo.get_git_commit(ref.object.sha)
+        published = {
+            element.path: element.sha
+            for element in repo.get_git_tree(parent.tree.sha, recursive=True).tree
+            if element.type == "blob" and (element.path.startswith(GALLERY_DIR + "/") or element.path == RANKINGS_STATE_PATH)
+        }
+
+        _, entries = read_published_index(repo, parent.sha)
+        rankings_state = None
+        if RANKINGS_STATE_PATH in published:
+            rankings_state = base64.b64decode(repo.get_git_blob(published[RANKINGS_STATE_PATH]).content).decode("utf-8")
+        wanted = gallery_files(entries, page_size, rankings_state=rankings_state)
+
+        tree_elements = [
+            InputGitTreeElement(path=path, mode="100644", type="blob", content=content)
+            for path, content in sorted(wanted.items())
+            if published.get(path) != git_blob_sha(content)
+        ]
+        # A null SHA removes the file from the tree
+        tree_elements.extend(
+            InputGitTreeElement(path=path, mode="100644", type="blob", sha=None)
+            for path in sorted(published)
+            if path not in wanted
+        )
+
+        if not tree_elements:
+            print("Gallery is up to date")
+            return False
+
+        tree = repo.create_git_tree(tree_elements, base_tree=parent.tree)
+        commit = repo.create_git_commit("chore: rebuild gallery pages", tree, [parent])
+        try:
+            ref.edit(commit.sha, force=False)
+            print(f"Published gallery ({len(tree_elements)} files changed)")
+            return True
+        except GithubException as e:
+            # 422 when the branch is no longer at the parent commit
+            if e.status != 422 or attempt == max_retries:
+                raise
+            print(f"WARNING: {branch} moved while publishing the gallery (attempt {attempt + 1}), generating again")
+
+        retry_pause(attempt)
+
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the gallery pages, tag index and ranked views from index.json")
+    parser.add_argument("command", nargs="?", choices=["build", "publish"], default="build", help="build: write the gallery to the working tree, publish: generate it from the published index.json and commit it through the GitHub API")
+    parser.add_argument("--root", default=".", help="Repository root")
+    parser.add_argument("--branch", default="main", help="Branch to publish to")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Summary records per page")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries after the branch moved during a publish")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_gallery(args.root, args.page_size)
+    else:
+        repo = make_github(os.environ["GITHUB_TOKEN"]).get_repo(os.environ["GITHUB_REPOSITORY"])
+        publish_gallery(repo, args.branch, args.page_size, args.max_retries)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
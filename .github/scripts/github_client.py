@@ -0,0 +1,370 @@
+# github_client.py
+# Shared GitHub request layer: rate-limit aware scheduling, jittered backoff and conditional GETs
+import os
+import time
+import hashlib
+import random
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Requests kept in reserve; below this the remaining budget is spread evenly until the reset
+DEFAULT_RESERVE = 100
+# GitHub asks for at least a second between mutating requests (secondary rate limit)
+DEFAULT_WRITE_INTERVAL = 1.0
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_ATTEMPTS = 6
+# Secondary rate limits come without a reset time, GitHub recommends waiting at least a minute
+SECONDARY_LIMIT_WAIT = 60.0
+MAX_BACKOFF = 15 * 60.0
+# Responses kept for If-None-Match revalidation
+DEFAULT_CACHE_ENTRIES = 512
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+WRITE_METHODS = frozenset(('POST', 'PATCH', 'PUT', 'DELETE'))
+
+log = logging.getLogger(__name__)
+
+_scheduler = None
+_conditional_cache = None
+_scheduler_lock = threading.Lock()
+# requests.Session of each thread, with the scheduled adapter mounted
+_thread_sessions = threading.local()
+
+
+def _resource_for(url):
+    path = urlparse(url).path
+    if path.startswith('/search/'):
+        return 'search'
+    if path.startswith('/graphql'):
+        return 'graphql'
+    return 'core'
+
+
+class RateLimitScheduler:
+    """
+    Paces requests against the primary and secondary GitHub rate limits.
+
+    The primary budget of each resource is read from the X-RateLimit-*
+    headers of every response. While plenty is left requests go out
+    immediately; below the reserve they are spread over the time left until
+    the reset, so a batch uses the whole quota without running out. Writes
+    are spaced for the secondary limit, and rate limited responses are
+    retried after the announced or a jittered exponential delay.
+    """
+
+    def __init__(self, reserve=DEFAULT_RESERVE, write_interval=DEFAULT_WRITE_INTERVAL,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 clock=time.time, sleep=time.sleep):
+        """
+        :param reserve: Remaining requests below which requests are paced
+        :param write_interval: Minimum seconds between mutating requests
+        :param max_concurrency: Maximum requests in flight at once
+        :param max_attempts: Attempts per request when rate limited
+        :param clock: Wall clock, the reset headers are epoch seconds
+        :param sleep: Sleep function, replaceable for simulations
+        """
+        self.reserve = reserve
+        self.write_interval = write_interval
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # resource -> (remaining, reset epoch)
+        self._budgets = {}
+        self._next_write = 0.0
+        # Earliest time any request may go out, set by a secondary rate limit
+        self._blocked_until = 0.0
+        self.stats = {'requests': 0, 'conditional_hits': 0, 'rate_limited': 0, 'waited_seconds': 0.0}
+
+    def count(self, name, amount=1):
+        """
+        Add to one of the stats counters, shared by every client thread.
+
+        :param name: Key of self.stats
+        :param amount: Increment
+        """
+        with self._lock:
+            self.stats[name] += amount
+
+    def _wait(self, seconds):
+        if seconds > 0:
+            self.count('waited_seconds', seconds)
+            self.sleep(seconds)
+
+    def acquire(self, method, url):
+        """
+        Wait until a request may be sent, then take a concurrency slot.
+
+        :param method: HTTP method
+        :param url: Request URL
+        """
+        resource = _resource_for(url)
+        with self._lock:
+            now = self.clock()
+            delay = max(self._blocked_until - now, 0.0)
+
+            remaining, reset = self._budgets.get(resource, (None, None))
+            if remaining is not None and reset is not None and reset > now:
+                if remaining <= 0:
+                    delay = max(delay, reset - now + random.uniform(0.5, 2.0))
+                elif remaining < self.reserve:
+                    # Spread what is left over the rest of the window
+                    delay = max(delay, (reset - now) / remaining)
+                # Count the request now so parallel callers see the smaller budget
+                self._budgets[resource] = (remaining - 1, reset)
+
+            if method.upper() in WRITE_METHODS:
+                delay = max(delay, self._next_write - now)
+                self._next_write = now + delay + self.write_interval
+
+            self.stats['requests'] += 1
+
+        self._wait(delay)
+        self._slots.acquire()
+
+    def release(self):
+        self._slots.release()
+
+    def update(self, url, response):
+        """
+        Record the budget announced by a response.
+
+        :param url: Request URL
+        :param response: requests.Response
+        """
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        resource = headers.get('X-RateLimit-Resource') or _resource_for(url)
+        with self._lock:
+            self._budgets[resource] = (int(remaining), int(reset))
+
+    def retry_delay(self, response, attempt):
+        """
+        Get how long to wait before retrying a response, if it was rate limited.
+
+        :param response: requests.Response
+        :param attempt: Number of attempts made so far, from 1
+        :return: Seconds to wait, or None if the response is final
+        """
+        if response.status_code not in (403, 429) or attempt >= self.max_attempts:
+            return None
+
+        headers = response.headers
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            delay = float(retry_after)
+        elif headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset'):
+            delay = int(headers['X-RateLimit-Reset']) - self.clock()
+        elif response.status_code == 429 or 'rate limit' in response.text.lower():
+            delay = SECONDARY_LIMIT_WAIT * 2 ** (attempt - 1)
+        else:
+            # A plain permission error
+            return None
+
+        # Jitter keeps parallel workers from retrying in lockstep
+        delay = min(max(delay, 1.0), MAX_BACKOFF) * random.uniform(1.0, 1.25)
+        with self._lock:
+            self.stats['rate_limited'] += 1
+            self._blocked_until = max(self._blocked_until, self.clock() + delay)
+        return delay
+
+
+class ConditionalCache:
+    """
+    LRU of GET responses with an ETag, revalidated with If-None-Match.
+
+    A 304 answer does not count against the primary rate limit and is
+    turned back into the cached response.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(request):
+        return request.url, request.headers.get('Accept'), request.headers.get('Authorization')
+
+    def get(self, request):
+        with self._lock:
+            entry = self._entries.get(self.key(request))
+            if entry is not None:
+                self._entries.move_to_end(self.key(request))
+            return entry
+
+    def put(self, request, response):
+        etag = response.headers.get('ETag')
+        content = response.content
+        if not etag or len(content) > self.max_bytes // 4:
+            return
+        key = self.key(request)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[key] = (etag, content, dict(response.headers), response.encoding)
+            self._bytes += len(content)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[1])
+
+
+def git_blob_sha(content):
+    """
+    Compute the git blob SHA of some content, as `git hash-object` would.
+
+    Compared with the SHAs of a tree it tells which files need uploading.
+
+    :param content: File content as str or bytes
+    :return: Hex SHA-1 string
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+def retry_pause(attempt):
+    """
+    Sleep before retrying a publish that lost a race, longer after each attempt.
+
+    The jitter keeps two racing runs from retrying at the same moment again.
+
+    :param attempt: Number of the failed attempt, from 0
+    """
+    time.sleep(random.uniform(0.5, 2.0) * (attempt + 1))
+
+
+def _adapter_class():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class ScheduledAdapter(HTTPAdapter):
+        """
+        HTTPAdapter sending every request through the scheduler and the conditional cache.
+        """
+
+        def __init__(self, scheduler, cache, **kwargs):
+            super().__init__(**kwargs)
+            self.scheduler = scheduler
+            self.cache = cache
+
+        def send(self, request, **kwargs):
+            # Requests that are already conditional (PyGithub's update()) are left alone
+            cached = None
+            if request.method == 'GET' and 'If-None-Match' not in request.headers:
+                cached = self.cache.get(request)
+                if cached is not None:
+                    request.headers['If-None-Match'] = cached[0]
+
+            attempt = 0
+            while True:
+                attempt += 1
+                self.scheduler.acquire(request.method, request.url)
+                try:
+                    response = super().send(request, **kwargs)
+                finally:
+                    self.scheduler.release()
+                self.scheduler.update(request.url, response)
+
+                delay = self.scheduler.retry_delay(response, attempt)
+                if delay is None:
+                    break
+                log.warning("Rate limited on %s %s, retrying in %.0fs", request.method, urlparse(request.url).path, delay)
+                # The next acquire() waits out the delay, for every thread
+                response.close()
+
+            if cached is not None and response.status_code == 304:
+                self.scheduler.count('conditional_hits')
+                etag, content, headers, encoding = cached
+                replayed = requests.Response()
+                replayed.status_code = 200
+                replayed.reason = 'OK'
+                # Fresh rate-limit headers, cached everything else
+                replayed.headers = requests.structures.CaseInsensitiveDict({**headers, **{
+                    name: value for name, value in response.headers.items() if name.lower().startswith('x-ratelimit')
+                }})
+                replayed._content = content
+                replayed.encoding = encoding
+                replayed.url = response.url
+                replayed.request = request
+                replayed.connection = self
+                return replayed
+
+            if request.method == 'GET' and response.status_code == 200:
+                self.cache.put(request, response)
+            return response
+
+    return ScheduledAdapter
+
+
+def get_scheduler():
+    """
+    Get the process-wide scheduler and conditional cache, rate limits are per token and shared by all clients.
+
+    :return: Tuple of (RateLimitScheduler, ConditionalCache)
+    """
+    global _scheduler, _conditional_cache
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler(
+                reserve=int(os.environ.get('GITHUB_RATE_RESERVE') or DEFAULT_RESERVE),
+                max_concurrency=int(os.environ.get('GITHUB_MAX_CONCURRENCY') or DEFAULT_MAX_CONCURRENCY)
+            )
+            _conditional_cache = ConditionalCache()
+        return _scheduler, _conditional_cache
+
+
+def make_github(token):
+    """
+    Create a PyGithub client whose requests go through the shared scheduler.
+
+    PyGithub's own fixed throttling is disabled, the scheduler paces by the
+    actual budget instead. Connection errors are still retried by urllib3.
+
+    PyGithub opens a connection object per request once a connection class
+    is injected, so threads never share one. The HTTP session behind it
+    belongs to the calling thread and outlives those connection objects,
+    which keeps its TLS connections warm.
+
+    :param token: GitHub token
+    :return: github.Github
+    """
+    from github import Auth, Github
+    from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+
+    scheduler, cache = get_scheduler()
+    adapter_class = _adapter_class()
+
+    class ScheduledConnection(HTTPSRequestsConnectionClass):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Only the thread's session is used, the one the base class created never opened a connection
+            self.session.close()
+            session = getattr(_thread_sessions, 'session', None)
+            if session is None:
+                import requests
+                session = requests.Session()
+                session.auth = Requester.noopAuth
+                session.mount('https://', adapter_class(
+                    scheduler, cache,
+                    max_retries=self.retry, pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                ))
+                _thread_sessions.session = session
+            self.session = session
+            self.adapter = session.get_adapter('https://')
+
+        def close(self):
+            # PyGithub closes the connection before opening the next one, the thread's session stays open
+            pass
+
+    Requester.injectConnectionClasses(HTTPRequestsConnectionClass, ScheduledConnection)
+    return Github(auth=Auth.Token(token), retry=3, seconds_between_requests=None, seconds_between_writes=None)
@@ -0,0 +1,156 @@
+# issue_form.py
+# Single-pass parser for GitHub issue-form bodies, typed by the fields of the issue template
+import re
+import functools
+from collections import namedtuple
+
+CONTRIBUTION_TEMPLATE = '.github/ISSUE_TEMPLATE/contribution.yaml'
+NO_RESPONSE = '_No response_'
+
+# "### Label" lines are the only structure GitHub puts around each answer.
+# Matching on a leading newline (instead of ^ with MULTILINE) lets the regex
+# engine jump between candidates with a fast literal search.
+HEADER_PATTERN = re.compile(r'\n###[ \t]+([^\r\n]+?)[ \t]*\r?(?=\n|\Z)')
+# Textareas with a "render" attribute are wrapped in a code fence
+FENCE = '```'
+CHECKBOX_PATTERN = re.compile(r'^- \[[xX]\] (.+?)\s*$', re.MULTILINE)
+
+FormField = namedtuple('FormField', ['id', 'label', 'type', 'multiple', 'render'])
+
+
+def label_key(label):
+    """
+    Turn a field label into the key used by the contribution processor.
+
+    :param label: Field label, e.g. "Content Rating (REQUIRED)"
+    :return: Key, e.g. "content_rating_(required)"
+    """
+    return label.strip().lower().replace(' ', '_')
+
+
+@functools.lru_cache(maxsize=None)
+def load_form_fields(template_path=CONTRIBUTION_TEMPLATE):
+    """
+    Read the answerable fields of an issue-form template.
+
+    :param template_path: Path to the issue template YAML
+    :return: Tuple of FormField
+    """
+    # Only needed once per template, the result is cached
+    import yaml
+
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template = yaml.safe_load(f)
+
+    fields = []
+    for element in template.get('body', []):
+        # Markdown elements are not rendered in the issue body
+        if element.get('type') == 'markdown':
+            continue
+        attributes = element.get('attributes', {})
+        fields.append(FormField(
+            id=element.get('id') or label_key(attributes['label']),
+            label=attributes['label'].strip(),
+            type=element['type'],
+            multiple=bool(attributes.get('multiple', False)),
+            render=attributes.get('render')
+        ))
+    return tuple(fields)
+
+
+class IssueFormParser:
+    """
+    Parse issue bodies created from an issue form into typed fields.
+
+    Inputs and single dropdowns become strings, multi-select dropdowns and
+    checkboxes become lists and textareas become raw blocks with their code
+    fence removed. Unanswered fields are '' or [].
+    """
+
+    def __init__(self, fields, key='id'):
+        """
+        :param fields: Iterable of FormField, see load_form_fields()
+        :param key: 'id' to key results by field id, 'label' to key them by label_key()
+        """
+        self.fields = tuple(fields)
+        self.key = key
+        self._by_label = {field.label: field for field in self.fields}
+
+    def _key_for(self, label, field):
+        if field is not None and self.key == 'id':
+            return field.id
+        return label_key(label)
+
+    def parse(self, body):
+        """
+        Parse an issue body in a single pass over its headers.
+
+        Headers that are not field labels (e.g. "###" inside a README) are kept
+        as part of the surrounding answer.
+
+        :param body: Raw issue body
+        :return: Dictionary of field key -> value
+        """
+        # The leading newline lets the first line match HEADER_PATTERN too
+        body = '\n' + (body or '')
+        known_labels = self._by_label
+
+        # Find the field headers, then slice the answers between them
+        headers = [
+            match for match in HEADER_PATTERN.finditer(body)
+            if not known_labels or match.group(1) in known_labels
+        ]
+
+        parsed = {}
+        for index, match in enumerate(headers):
+            end = headers[index + 1].start() if index + 1 < len(headers) else len(body)
+            label = match.group(1)
+            field = known_labels.get(label)
+            parsed[self._key_for(label, field)] = self._convert(body[match.end():end].strip(), field)
+
+        return parsed
+
+    @staticmethod
+    def _convert(text, field):
+        """
+        Convert the raw answer of a field to its typed value.
+
+        :param text: Stripped answer text
+        :param field: FormField or None for unknown headers
+        :return: str or list
+        """
+        field_type = field.type if field else 'input'
+        no_response = text == NO_RESPONSE
+
+        if field_type == 'textarea':
+            if no_response:
+                return ''
+            if field.render and text.startswith(FENCE) and text.endswith(FENCE) and '\n' in text:
+                # Drop the opening "```lang" line and the closing fence
+                return text[text.index('\n') + 1:-len(FENCE)].rstrip('\r\n')
+            return text
+
+        if field_type == 'checkboxes':
+            return CHECKBOX_PATTERN.findall(text)
+
+        if field_type == 'dropdown' and field.multiple:
+            if no_response or not text:
+                return []
+            return [value.strip() for value in text.split(', ') if value.strip()]
+
+        if no_response:
+            return ''
+        # Single line answers: keep the first line only
+        return text.split('\n', 1)[0].strip()
+
+
+@functools.lru_cache(maxsize=None)
+def get_form_parser(template_path=CONTRIBUTION_TEMPLATE, key='id'):
+    """
+    Get a cached parser for an issue template.
+
+    :param template_path: Path to the issue template YAML
+    :param key: 'id' or 'label', see IssueFormParser
+    :return: IssueFormParser
+    """
+    return IssueFormParser(load_form_fields(template_path), key=key)
@@ -0,0 +1,284 @@
+# manifest_schema.py
+# Full manifest schema and its ahead-of-time compiled validator
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import importlib.util
+
+# Bump when the generated code changes, so cached validators are regenerated
+GENERATOR_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "manifest-validator")
+
+STRING_LIST = {"type": "array", "items": {"type": "string"}}
+COUNTER = {"type": "integer", "minimum": 0}
+
+DEPENDENCY = {
+    "type": "object",
+    "required": ["name"],
+    "properties": {
+        "name": {"type": "string"},
+        "rating": {"type": "string"},
+        "dbUrl": {"type": "string"},
+        "shareUrl": {"type": "string"},
+        "downloadUrl": {"type": "string"},
+        "reason": {"type": "string"}
+    }
+}
+
+# create-new-content-from-submission.py records the submitter instead of a numeric id
+AUTHOR_ID = {
+    "type": ["integer", "string", "object"],
+    "properties": {
+        "githubUsername": {"type": "string"},
+        "submissionDate": {"type": "string"}
+    }
+}
+
+# Matches the manifests written by ContributionProcessor.process_character and
+# create-new-content-from-submission.py. Lorebooks only carry name, description
+# and author, so everything else is optional.
+MANIFEST_SCHEMA = {
+    "type": "object",
+    "required": ["name", "description", "author"],
+    "properties": {
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "author": {"type": "string"},
+        "authorId": AUTHOR_ID,
+        "imageUrl": {"type": "string"},
+        "shareUrl": {"type": "string"},
+        "downloadPath": {"type": "string"},
+        "shapeShifter_Pulls": COUNTER,
+        "galleryChat_Clicks": COUNTER,
+        "galleryDownload_Clicks": COUNTER,
+        "groupSettings": {
+            "type": "object",
+            "properties": {
+                "requires": {"type": "array", "items": DEPENDENCY},
+                "recommends": {"type": "array", "items": DEPENDENCY}
+            }
+        },
+        "features": {
+            "type": "object",
+            "properties": {
+                "customCode": STRING_LIST,
+                "assets": STRING_LIST
+            }
+        },
+        "categories": {
+            "type": "object",
+            "properties": {
+                # A list like the other categories when rating is a required category of categories.json
+                "rating": {"type": ["string", "array"], "items": {"type": "string"}}
+            },
+            # Tag lists, or a single string placeholder for required categories
+            "additionalProperties": {"type": ["array", "string"], "items": {"type": "string"}}
+        }
+    }
+}
+
+# Same semantics as the Draft 7 type checker of jsonschema
+TYPE_CHECKS = {
+    "object": "isinstance(instance, dict)",
+    "array": "isinstance(instance, list)",
+    "string": "isinstance(instance, str)",
+    "boolean": "isinstance(instance, bool)",
+    "null": "instance is None",
+    "number": "(isinstance(instance, (int, float)) and not isinstance(instance, bool))",
+    "integer": "((isinstance(instance, int) and not isinstance(instance, bool)) or (isinstance(instance, float) and instance.is_integer()))",
+}
+
+# Keywords that do not validate anything
+ANNOTATIONS = {"title", "description", "$comment", "$schema", "default", "examples"}
+
+
+class SchemaError(Exception):
+    """
+    One schema violation, with the same message and path jsonschema reports.
+    """
+
+    def __init__(self, message, path, validator):
+        """
+        :param message: Error message, identical to jsonschema's
+        :param path: Tuple of keys and indexes leading to the invalid value
+        :param validator: Schema keyword that failed, e.g. "type"
+        """
+        super().__init__(message)
+        self.message = message
+        self.path = path
+        self.validator = validator
+
+
+class _Compiler:
+    """
+    Turns a schema into Python source, one generator function per schema node.
+    """
+
+    def __init__(self):
+        self.functions = []
+        self.constants = []
+
+    def compile(self, schema):
+        """
+        Generate the function validating one schema node.
+
+        :param schema: Schema dictionary
+        :return: Name of the generated function
+        """
+        index = len(self.functions)
+        name = f"_validate_{index}"
+        # Reserve the slot first, sub-schemas compiled below take the following ones
+        self.functions.append(None)
+        lines = [f"def {name}(instance, path):"]
+
+        # Same keyword order as the schema, like jsonschema.iter_errors
+        for keyword, value in schema.items():
+            if keyword in ANNOTATIONS:
+                continue
+            handler = getattr(self, f"_keyword_{keyword}", None)
+            if handler is None:
+                raise ValueError(f"Unsupported schema keyword: {keyword}")
+            lines.extend("    " + line for line in handler(value, schema))
+
+        # Makes the function a generator even when it checks nothing
+        lines.extend(["    return", "    yield"])
+        self.functions[index] = "\n".join(lines)
+        return name
+
+    def _keyword_type(self, value, schema):
+        types = value if isinstance(value, list) else [value]
+        condition = " or ".join(TYPE_CHECKS[schema_type] for schema_type in types)
+        suffix = " is not of type " + ", ".join(repr(schema_type) for schema_type in types)
+        return [
+            f"if not ({condition}):",
+            f"    yield SchemaError(repr(instance) + {suffix!r}, path, 'type')"
+        ]
+
+    def _keyword_required(self, value, schema):
+        lines = ["if isinstance(instance, dict):"]
+        for prop in value:
+            lines.append(f"    if {prop!r} not in instance:")
+            lines.append(f"        yield SchemaError({repr(prop) + ' is a required property'!r}, path, 'required')")
+        return lines
+
+    def _keyword_properties(self, value, schema):
+        lines = ["if isinstance(instance, dict):"]
+        for prop, subschema in value.items():
+            function = self.compile(subschema)
+            lines.append(f"    if {prop!r} in instance:")
+            lines.append(f"        yield from {function}(instance[{prop!r}], path + ({prop!r},))")
+        return lines
+
+    def _keyword_additionalProperties(self, value, schema):
+        if value is True:
+            return []
+        if value is False:
+            raise ValueError("additionalProperties: false is not supported")
+        function = self.compile(value)
+        # Module level constant, so the set is built once instead of on every call
+        known = f"_KNOWN_PROPERTIES_{len(self.constants)}"
+        self.constants.append(f"{known} = {frozenset(schema.get('properties', {}))!r}")
+        return [
+            "if isinstance(instance, dict):",
+            "    for key, value in instance.items():",
+            f"        if key not in {known}:",
+            f"            yield from {function}(value, path + (key,))"
+        ]
+
+    def _keyword_items(self, value, schema):
+        if not isinstance(value, dict):
+            raise ValueError("Only a single schema is supported for items")
+        function = self.compile(value)
+        return [
+            "if isinstance(instance, list):",
+            "    for index, item in enumerate(instance):",
+            f"        yield from {function}(item, path + (index,))"
+        ]
+
+    def _keyword_enum(self, value, schema):
+        return [
+            f"if instance not in {value!r}:",
+            f"    yield SchemaError(repr(instance) + {' is not one of ' + repr(value)!r}, path, 'enum')"
+        ]
+
+    def _keyword_minimum(self, value, schema):
+        return [
+            f"if isinstance(instance, (int, float)) and not isinstance(instance, bool) and instance < {value!r}:",
+            f"    yield SchemaError(repr(instance) + {' is less than the minimum of ' + repr(value)!r}, path, 'minimum')"
+        ]
+
+
+def schema_hash(schema=MANIFEST_SCHEMA):
+    """
+    Hash a schema together with the generator version.
+
+    :param schema: Schema dictionary
+    :return: Hex SHA-256
+    """
+    return hashlib.sha256(json.dumps([GENERATOR_VERSION, schema], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def generate_validator_source(schema=MANIFEST_SCHEMA):
+    """
+    Generate the Python source of a validator module for a schema.
+
+    The module exposes iter_errors(instance), yielding SchemaError with the
+    same messages and paths as jsonschema, in schema keyword order.
+
+    :param schema: Schema dictionary
+    :return: Python source code
+    """
+    compiler = _Compiler()
+    compiler.compile(schema)
+
+    header = [
+        "# Generated by manifest_schema.py, do not edit.",
+        f"# Schema hash: {schema_hash(schema)}",
+        "from manifest_schema import SchemaError",
+        ""
+    ]
+    footer = [
+        "",
+        "def iter_errors(instance):",
+        "    return _validate_0(instance, ())",
+        ""
+    ]
+    return "\n".join(header + compiler.constants + [""] + ["\n\n".join(compiler.functions)] + footer)
+
+
+def load_validator(schema=MANIFEST_SCHEMA, cache_dir=None):
+    """
+    Load the compiled validator of a schema, generating it on a cache miss.
+
+    Generated modules are stored as manifest_validator_<schema hash>.py, so
+    any change to the schema or the generator produces a new file.
+
+    :param schema: Schema dictionary
+    :param cache_dir: Directory of generated modules, defaults to MANIFEST_VALIDATOR_CACHE or ~/.cache
+    :return: iter_errors function of the generated module
+    """
+    cache_dir = cache_dir or os.environ.get("MANIFEST_VALIDATOR_CACHE") or DEFAULT_CACHE_DIR
+    module_name = f"manifest_validator_{schema_hash(schema)[:16]}"
+    if module_name in sys.modules:
+        return sys.modules[module_name].iter_errors
+
+    module_path = os.path.join(cache_dir, module_name + ".py")
+    if not os.path.exists(module_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Concurrent workers may generate at the same time, publish atomically
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(generate_validator_source(schema))
+            os.replace(tmp_path, module_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[module_name] = module
+    return module.iter_errors
@@ -0,0 +1,316 @@
+# metrics.py
+# Batched ingestion of gallery click events into the manifest counters
+import os
+import sys
+import json
+import hashlib
+import argparse
+from collections import Counter
+
+from character_index import CHARACTERS_DIR, build_index, fragment_path, is_character_path, render_fragment
+from github_client import make_github, retry_pause
+
+# Event name -> manifest counter it increments
+EVENT_COUNTERS = {
+    "pull": "shapeShifter_Pulls",
+    "chat": "galleryChat_Clicks",
+    "download": "galleryDownload_Clicks",
+}
+
+# Offsets of the logs already applied, committed together with the counters they produced
+STATE_PATH = f"{CHARACTERS_DIR}/metrics-state.json"
+STATE_VERSION = 1
+# Bytes at the start of a log used to recognise it after a rotation
+HEAD_BYTES = 4096
+READ_CHUNK = 1024 * 1024
+
+
+def log_files(source):
+    """
+    List the event logs of a file or directory.
+
+    :param source: Path of a JSONL file or of a directory of them
+    :return: List of (log name, file path), the name is the key in the offsets state
+    """
+    if os.path.isfile(source):
+        return [(os.path.basename(source), source)]
+
+    logs = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".jsonl"):
+                file_path = os.path.join(dirpath, filename)
+                logs.append((os.path.relpath(file_path, source).replace(os.sep, "/"), file_path))
+    return logs
+
+
+def _head_hash(file_path, length):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+
+def read_events(file_path, offset):
+    """
+    Stream the complete lines of a log from an offset.
+
+    A trailing line without a newline is still being written and is left
+    for the next run.
+
+    :param file_path: Path of the JSONL log
+    :param offset: Byte offset to start from
+    :return: Generator of raw lines, its return value is the offset after the last complete line
+    """
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        pending = b""
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                offset += len(line) + 1
+                yield line
+    return offset
+
+
+def aggregate(source, state):
+    """
+    Sum the counter deltas of all events not applied yet, in one pass over the logs.
+
+    :param source: Path of a JSONL file or of a directory of them
+    :param state: Offsets state, see load_state()
+    :return: Tuple of (Counter of (character path, counter) -> delta, new offsets, number of skipped lines)
+    """
+    deltas = Counter()
+    offsets = dict(state["logs"])
+    skipped = 0
+
+    for name, file_path in log_files(source):
+        previous = offsets.get(name)
+        offset = 0
+        # A log that shrank or starts differently was rotated, read it from the start.
+        # Only bytes already applied are compared, the log may still be growing.
+        if (previous and previous["offset"] <= os.path.getsize(file_path)
+                and _head_hash(file_path, min(previous["offset"], HEAD_BYTES)) == previous["head"]):
+            offset = previous["offset"]
+
+        events = read_events(file_path, offset)
+        while True:
+            try:
+                line = next(events)
+            except StopIteration as stop:
+                offset = stop.value
+                break
+
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                counter = EVENT_COUNTERS[event["event"]]
+                count = int(event.get("count", 1))
+                path = event["path"]
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            # The path becomes a file path below index.d/ and the characters directory
+            if not is_character_path(path):
+                skipped += 1
+                continue
+            if count > 0:
+                deltas[(path, counter)] += count
+
+        offsets[name] = {"offset": offset, "head": _head_hash(file_path, min(offset, HEAD_BYTES))}
+
+    return deltas, offsets, skipped
+
+
+def load_state(content):
+    """
+    Parse the offsets state.
+
+    :param content: Content of metrics-state.json, or None if it does not exist yet
+    :return: State dictionary
+    """
+    if content is None:
+        return {"version": STATE_VERSION, "logs": {}}
+    state = json.loads(content)
+    if state.get("version") != STATE_VERSION:
+        raise ValueError(f"Unsupported metrics state version {state.get('version')}")
+    return state
+
+
+def render_state(offsets):
+    return json.dumps({"version": STATE_VERSION, "logs": dict(sorted(offsets.items()))}, indent=2) + "\n"
+
+
+def apply_deltas(deltas, read):
+    """
+    Apply counter deltas to the index fragments and manifest.json files.
+
+    :param deltas: Counter of (character path, counter) -> delta
+    :param read: Function returning the content of a repository path, or None if it does not exist
+    :return: Tuple of (dictionary of repository path -> new content, list of unknown character paths)
+    """
+    by_character = {}
+    for (path, counter), delta in deltas.items():
+        by_character.setdefault(path, {})[counter] = delta
+
+    files = {}
+    unknown = []
+    for path, counters in sorted(by_character.items()):
+        if not is_character_path(path):
+            unknown.append(path)
+            continue
+        fragment_file = fragment_path(path)
+        content = read(fragment_file)
+        if content is None:
+            unknown.append(path)
+            continue
+
+        entry = json.loads(content)
+        for counter, delta in counters.items():
+            entry["manifest"][counter] = entry["manifest"].get(counter, 0) + delta
+        files[fragment_file] = render_fragment(entry)
+
+        # Characters added through the contribution processor also have their own manifest.json
+        manifest_file = f"{CHARACTERS_DIR}/{path}/manifest.json"
+        content = read(manifest_file)
+        if content is not None:
+            manifest = json.loads(content)
+            for counter, delta in counters.items():
+                manifest[counter] = manifest.get(counter, 0) + delta
+            files[manifest_file] = json.dumps(manifest, indent=2)
+
+    return files, unknown
+
+
+class WorkingTree:
+    """
+    Reads and writes files of a local checkout.
+    """
+
+    def __init__(self, root="."):
+        self.root = root
+
+    def read(self, path):
+        file_path = os.path.join(self.root, path)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def write(self, files, message):
+        # The state goes last: an interrupted local run counts events twice rather than losing them.
+        # Use --publish for exactly-once updates, it commits counters and state together.
+        for path in sorted(files, key=lambda path: path == STATE_PATH):
+            with open(os.path.join(self.root, path), "w", encoding="utf-8") as f:
+                f.write(files[path])
+        build_index(self.root)
+        return True
+
+
+class Branch:
+    """
+    Reads files at the head of a branch and writes them back as one commit.
+    """
+
+    def __init__(self, repo, branch):
+        self.repo = repo
+        self.branch = branch
+        self.ref = repo.get_git_ref(f"heads/{branch}")
+        self.head = repo.get_git_commit(self.ref.object.sha)
+
+    def read(self, path):
+        from github import GithubException
+
+        try:
+            return self.repo.get_contents(path, ref=self.head.sha).decoded_content.decode("utf-8")
+        except GithubException as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def write(self, files, message):
+        """
+        Commit the files on top of the head that was read.
+
+        :return: False if the branch moved since it was read
+        """
+        from github import GithubException, InputGitTreeElement
+
+        tree_elements = [
+            InputGitTreeElement(path=path, mode="100644", type="blob", content=content)
+            for path, content in sorted(files.items())
+        ]
+        tree = self.repo.create_git_tree(tree_elements, base_tree=self.head.tree)
+        commit = self.repo.create_git_commit(message, tree, [self.head])
+        try:
+            self.ref.edit(commit.sha, force=False)
+        except GithubException as e:
+            if e.status != 422:
+                raise
+            return False
+        print(f"Committed {len(files)} files as {commit.sha}")
+        return True
+
+
+def ingest(source, store):
+    """
+    Apply every event of the logs not applied yet, in one batched write.
+
+    Counters and the new log offsets are written together, so running the
+    ingestion again over the same logs changes nothing.
+
+    :param source: Path of a JSONL file or of a directory of them
+    :param store: WorkingTree or Branch
+    :return: False if the write was rejected because the branch moved
+    """
+    state = load_state(store.read(STATE_PATH))
+    deltas, offsets, skipped = aggregate(source, state)
+    if skipped:
+        print(f"WARNING: Skipped {skipped} malformed events")
+
+    if offsets == state["logs"]:
+        print("No new events")
+        return True
+
+    files, unknown = apply_deltas(deltas, store.read)
+    for path in unknown:
+        print(f"WARNING: Ignoring events for unknown character {path}")
+
+    files[STATE_PATH] = render_state(offsets)
+    events = sum(delta for (path, _), delta in deltas.items() if path not in unknown)
+    print(f"Applying {events} events to {len(files) - 1} files")
+    return store.write(files, f"chore: update usage counters ({events} events)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply click-event logs to the manifest counters")
+    parser.add_argument("source", help="JSONL event log, or a directory of them")
+    parser.add_argument("--root", default=".", help="Repository root, for local runs")
+    parser.add_argument("--publish", action="store_true", help="Commit to a branch through the GitHub API instead of the working tree")
+    parser.add_argument("--branch", default="main", help="Branch to publish to")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries when the branch moved during a publish")
+    args = parser.parse_args()
+
+    if not args.publish:
+        ingest(args.source, WorkingTree(args.root))
+        return 0
+
+    repo = make_github(os.environ["GITHUB_TOKEN"]).get_repo(os.environ["GITHUB_REPOSITORY"])
+    for attempt in range(args.max_retries + 1):
+        # Offsets and counters are read again from the new head, nothing is applied twice
+        if ingest(args.source, Branch(repo, args.branch)):
+            return 0
+        print(f"WARNING: {args.branch} moved while publishing counters (attempt {attempt + 1}), retrying")
+        retry_pause(attempt)
+
+    print("ERROR: Could not publish counters")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
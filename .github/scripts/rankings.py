@@ -0,0 +1,195 @@
+# rankings.py
+# Precomputed top-N popular and trending lists per category and tag
+import json
+import heapq
+
+from character_index import CHARACTERS_DIR
+from category_registry import get_registry
+from tag_index import character_tags
+
+# Counters of each character at the last run and their trending score, updated incrementally
+STATE_PATH = f"{CHARACTERS_DIR}/rankings-state.json"
+STATE_VERSION = 1
+RANKINGS_VERSION = 1
+DEFAULT_TOP_N = 50
+# Time for a counter increase to lose half of its trending weight
+HALF_LIFE_SECONDS = 7 * 24 * 3600
+# Rebase the scores before the forward-decay weights get close to the float range
+MAX_EXPONENT = 512
+
+COUNTERS = ("shapeShifter_Pulls", "galleryChat_Clicks", "galleryDownload_Clicks")
+
+_SEPARATORS = (",", ":")
+
+
+def load_state(content, now):
+    """
+    Parse the rankings state.
+
+    :param content: Content of rankings-state.json, or None if it does not exist yet
+    :param now: Current time in seconds since the epoch, starts the decay epoch of a new state
+    :return: State dictionary
+    """
+    if content is None:
+        return {"version": STATE_VERSION, "epoch": int(now), "characters": {}}
+    state = json.loads(content)
+    if state.get("version") != STATE_VERSION:
+        raise ValueError(f"Unsupported rankings state version {state.get('version')}")
+    return state
+
+
+def render_state(state):
+    state = dict(state, characters=dict(sorted(state["characters"].items())))
+    return json.dumps(state, separators=_SEPARATORS) + "\n"
+
+
+def popularity(manifest):
+    return sum(manifest.get(counter, 0) for counter in COUNTERS)
+
+
+def update_trending(state, manifests_by_path, now):
+    """
+    Fold counter increases since the last run into the trending scores.
+
+    Scores use forward decay: an increase at time t is weighted by
+    2 ** ((t - epoch) / half life) and never touched again. Ordering by the
+    stored score is the same as ordering by the exponentially decayed one,
+    so characters whose counters did not change are not rescored.
+
+    :param state: State from load_state(), updated in place
+    :param manifests_by_path: Dictionary of character path -> manifest
+    :param now: Current time in seconds since the epoch
+    :return: True if the state changed
+    """
+    characters = state["characters"]
+    changed = False
+
+    exponent = (now - state["epoch"]) / HALF_LIFE_SECONDS
+    if exponent > MAX_EXPONENT:
+        # Same relative order, smaller numbers
+        scale = 2.0 ** -exponent
+        for record in characters.values():
+            record["trending"] *= scale
+        state["epoch"] = int(now)
+        exponent = 0.0
+        changed = True
+    weight = 2.0 ** exponent
+
+    for path in set(characters) - set(manifests_by_path):
+        del characters[path]
+        changed = True
+
+    for path, manifest in manifests_by_path.items():
+        counters = [manifest.get(counter, 0) for counter in COUNTERS]
+        record = characters.get(path)
+        if record is None:
+            # Existing totals are history, only increases from now on are trending
+            characters[path] = {"counters": counters, "trending": 0.0}
+            changed = True
+        elif record["counters"] != counters:
+            increase = sum(max(new - old, 0) for new, old in zip(counters, record["counters"]))
+            record["counters"] = counters
+            record["trending"] += increase * weight
+            changed = True
+
+    return changed
+
+
+class TopK:
+    """
+    Bounded min-heap keeping the k best (score, id) pairs, ties go to the lower id.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def push(self, score, character_id):
+        # Negated id, so of two equal scores the lower id compares greater and is kept
+        item = (score, -character_id)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def ids(self):
+        return [-negated_id for _, negated_id in sorted(self.heap, reverse=True)]
+
+
+def build_rankings(entries, state, registry=None, top_n=DEFAULT_TOP_N):
+    """
+    Build the popular and trending top-N lists, overall and per category tag.
+
+    Memory is one bounded heap per list, independent of the catalog size.
+
+    :param entries: Index entries in character ID order
+    :param state: State updated by update_trending()
+    :param registry: CategoryRegistry, defaults to the one of categories.json
+    :param top_n: Length of each list
+    :return: Dictionary of view -> {"all": [ids], category: {tag: [ids]}}
+    """
+    registry = registry or get_registry()
+    heaps = {
+        view: {"all": TopK(top_n), "tags": {}}
+        for view in ("popular", "trending")
+    }
+
+    for character_id, entry in enumerate(entries):
+        manifest = entry["manifest"]
+        record = state["characters"].get(entry["path"])
+        scores = {
+            "popular": popularity(manifest),
+            "trending": record["trending"] if record else 0.0
+        }
+        tags = set(character_tags(manifest.get("categories", {}), registry))
+
+        for view, score in scores.items():
+            # Characters nobody used do not rank
+            if score <= 0:
+                continue
+            heaps[view]["all"].push(score, character_id)
+            for tag in tags:
+                tag_heaps = heaps[view]["tags"]
+                if tag not in tag_heaps:
+                    tag_heaps[tag] = TopK(top_n)
+                tag_heaps[tag].push(score, character_id)
+
+    rankings = {}
+    for view, view_heaps in heaps.items():
+        ranking = {"all": view_heaps["all"].ids()}
+        for (name, tag), heap in sorted(view_heaps["tags"].items()):
+            ranking.setdefault(name, {})[tag] = heap.ids()
+        rankings[view] = ranking
+    return rankings
+
+
+def render_rankings(rankings, top_n):
+    """
+    Serialize the ranked views compactly.
+
+    :param rankings: Dictionary from build_rankings()
+    :param top_n: Length of each list
+    :return: JSON string
+    """
+    return json.dumps(
+        {"version": RANKINGS_VERSION, "size": top_n, **rankings},
+        separators=_SEPARATORS,
+        ensure_ascii=False
+    )
+
+
+def ranked_views(entries, state_content, now, registry=None, top_n=DEFAULT_TOP_N):
+    """
+    Update the trending state and build the ranked views.
+
+    :param entries: Index entries in character ID order
+    :param state_content: Content of rankings-state.json, or None
+    :param now: Current time in seconds since the epoch
+    :param registry: CategoryRegistry, defaults to the one of categories.json
+    :param top_n: Length of each list
+    :return: Tuple of (rankings JSON, new state content, or the old content if unchanged)
+    """
+    state = load_state(state_content, now)
+    if update_trending(state, {entry["path"]: entry["manifest"] for entry in entries}, now):
+        state_content = render_state(state)
+    return render_rankings(build_rankings(entries, state, registry, top_n), top_n), state_content
@@ -0,0 +1,91 @@
+# spool.py
+# Directory spool of contribution jobs for the persistent processor worker
+import os
+import json
+import time
+import uuid
+import tempfile
+
+SPOOL_DIRS = ('tmp', 'incoming', 'processing', 'done', 'failed')
+
+
+class DirectorySpool:
+    """
+    Jobs as JSON files moving through incoming/ -> processing/ -> done/ or failed/.
+
+    Every move is an os.rename inside one directory tree, so a job is
+    claimed by exactly one worker and a crash never leaves half written
+    files in incoming/.
+    """
+
+    def __init__(self, spool_dir):
+        """
+        :param spool_dir: Root directory of the spool, created if missing
+        """
+        self.spool_dir = spool_dir
+        for name in SPOOL_DIRS:
+            os.makedirs(os.path.join(spool_dir, name), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self.spool_dir, state, name)
+
+    def enqueue(self, job):
+        """
+        Add a job to the spool.
+
+        :param job: JSON serializable job, e.g. {"issue": 12, "action": "edited"}
+        :return: Name of the job file
+        """
+        # Names sort in enqueue order
+        name = f"{time.time_ns():020d}-{job.get('issue', 'job')}-{uuid.uuid4().hex[:8]}.json"
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.spool_dir, 'tmp'), suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path('incoming', name))
+        return name
+
+    def claim(self):
+        """
+        Claim every job waiting in incoming/.
+
+        :return: List of (name, job) in enqueue order
+        """
+        claimed = []
+        for name in sorted(os.listdir(os.path.join(self.spool_dir, 'incoming'))):
+            if not name.endswith('.json'):
+                continue
+            try:
+                os.rename(self._path('incoming', name), self._path('processing', name))
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            with open(self._path('processing', name), 'r', encoding='utf-8') as f:
+                claimed.append((name, json.load(f)))
+        return claimed
+
+    def complete(self, name, job, result, failed=False):
+        """
+        Move a claimed job to done/ or failed/ together with its result.
+
+        :param name: Name of the job file
+        :param job: Job dictionary
+        :param result: Result dictionary stored under "result"
+        :param failed: Move to failed/ instead of done/
+        """
+        target = self._path('failed' if failed else 'done', name)
+        with open(target, 'w', encoding='utf-8') as f:
+            json.dump({**job, 'result': result}, f, indent=2)
+        os.remove(self._path('processing', name))
+
+    def recover(self):
+        """
+        Put jobs left in processing/ by a crashed worker back into incoming/.
+
+        Only call this when no other worker uses the spool.
+
+        :return: Number of jobs recovered
+        """
+        names = [name for name in os.listdir(os.path.join(self.spool_dir, 'processing')) if name.endswith('.json')]
+        for name in names:
+            os.rename(self._path('processing', name), self._path('incoming', name))
+        return len(names)
@@ -0,0 +1,97 @@
+# submission_ledger.py
+# Records what was last processed for an issue in a hidden comment, so unchanged re-runs are no-ops
+import re
+import json
+import hashlib
+import datetime
+from urllib.parse import urlparse, parse_qs
+
+# Bump when the processor output changes for the same submission, so every issue is processed again
+LEDGER_VERSION = 2
+LEDGER_MARKER = 'contribution-ledger'
+LEDGER_PATTERN = re.compile(r'<!--\s*' + LEDGER_MARKER + r'\s+(\{.*?\})\s*-->', re.DOTALL)
+
+
+def share_file_id(share_url):
+    """
+    Extract the file id from a Perchance character share URL.
+
+    :param share_url: URL such as https://perchance.org/ai-character-chat?data=Name~abc123.gz
+    :return: File id, e.g. "abc123.gz", or '' if the URL has none
+    """
+    data_param = parse_qs(urlparse(share_url or '').query).get('data', [''])[0]
+    return data_param.split('~')[-1]
+
+
+def submission_hash(fields, login, share_url, categories_hash):
+    """
+    Hash everything the processor output depends on.
+
+    Perchance file ids are content hashes, so the id stands in for the
+    downloaded file and nothing needs to be downloaded to compare.
+
+    :param fields: Issue form fields the output is built from, see ContributionProcessor.submission_fields()
+    :param login: Login of the issue author, the fallback author name
+    :param share_url: Perchance character share URL
+    :param categories_hash: Content hash of categories.json, tags are canonicalized against it
+    :return: Hex SHA-256
+    """
+    canonical = json.dumps({
+        'version': LEDGER_VERSION,
+        'fields': fields,
+        'login': login,
+        'share_file': share_file_id(share_url),
+        'categories': categories_hash
+    }, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def find_ledger(issue):
+    """
+    Find the ledger comment of an issue.
+
+    :param issue: PyGithub issue
+    :return: Tuple of (comment or None, record dictionary or None)
+    """
+    for comment in issue.get_comments():
+        match = LEDGER_PATTERN.search(comment.body or '')
+        if match:
+            try:
+                return comment, json.loads(match.group(1))
+            except ValueError:
+                return comment, None
+    return None, None
+
+
+def render_ledger(record):
+    """
+    Build the ledger comment body, a short note with the record hidden in an HTML comment.
+
+    :param record: Dictionary with hash, branch and pull_request
+    :return: Comment body
+    """
+    note = f"Contribution processed into #{record['pull_request']}." if record.get('pull_request') else "Contribution processed."
+    return f"{note}\n\n<!-- {LEDGER_MARKER} {json.dumps(record, sort_keys=True)} -->"
+
+
+def write_ledger(issue, comment, digest, branch_name, pull_request):
+    """
+    Create or update the ledger comment after a successful run.
+
+    :param issue: PyGithub issue
+    :param comment: Existing ledger comment from find_ledger(), or None
+    :param digest: Hash from submission_hash()
+    :param branch_name: Contribution branch
+    :param pull_request: Pull request number, or None
+    """
+    record = {
+        'hash': digest,
+        'branch': branch_name,
+        'pull_request': pull_request,
+        'processed_at': datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()
+    }
+    body = render_ledger(record)
+    if comment is None:
+        issue.create_comment(body)
+    else:
+        comment.edit(body)
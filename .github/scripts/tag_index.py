@@ -0,0 +1,75 @@
+# tag_index.py
+# Inverted index from the tags of categories.json to the characters carrying them
+import json
+
+from category_registry import get_registry
+
+TAG_INDEX_VERSION = 1
+
+_SEPARATORS = (",", ":")
+
+
+def character_tags(categories, registry):
+    """
+    Get the canonical tags of a manifest's categories block.
+
+    Tags are matched case-insensitively against categories.json using the
+    manifest's rating. Unknown tags and placeholders like "blank" are dropped.
+
+    :param categories: Manifest categories, category name -> list of tags or string
+    :param registry: CategoryRegistry
+    :return: Iterable of (category name, canonical tag)
+    """
+    rating = categories.get("rating", "")
+    for name, value in categories.items():
+        values = value if isinstance(value, list) else str(value or "").split(",")
+        for tag in values:
+            canonical = registry.canonical_tag(name, tag, rating)
+            if canonical is not None:
+                yield name.lower(), canonical
+
+
+def build_tag_index(manifests, registry=None):
+    """
+    Build the inverted tag index.
+
+    Characters are identified by their position in `manifests`, so the IDs
+    line up with the gallery records when both use the same order. Every
+    tag of categories.json is present, with an empty list if unused.
+
+    :param manifests: Manifests in ID order
+    :param registry: CategoryRegistry, defaults to the one of categories.json
+    :return: Dictionary of category name -> tag -> sorted list of IDs
+    """
+    registry = registry or get_registry()
+    index = {
+        name: {tag: [] for tag in sorted(registry.valid_tags(name, "nsfw"))}
+        for name in registry.names
+    }
+
+    for character_id, manifest in enumerate(manifests):
+        # A character listing a tag twice must only appear once in its list
+        for name, tag in sorted(set(character_tags(manifest.get("categories", {}), registry))):
+            index[name][tag].append(character_id)
+
+    return index
+
+
+def render_tag_index(index, total):
+    """
+    Serialize the tag index compactly, with the precomputed count of every tag.
+
+    ID lists are ascending, so clients answer AND filters by intersecting
+    and OR filters by merging sorted lists.
+
+    :param index: Dictionary from build_tag_index()
+    :param total: Number of characters
+    :return: JSON string
+    """
+    tag_index = {
+        "version": TAG_INDEX_VERSION,
+        "total": total,
+        "counts": {name: {tag: len(ids) for tag, ids in tags.items()} for name, tags in index.items()},
+        "ids": index
+    }
+    return json.dumps(tag_index, separators=_SEPARATORS, ensure_ascii=False)
@@ -0,0 +1,79 @@
+# test_manifest_schema.py
+# Manifests written by the submission scripts must pass the compiled manifest validator
+# Usage: python -m unittest discover -s .github/scripts/tests
+import os
+import sys
+import tempfile
+import unittest
+import importlib.util
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(SCRIPTS_DIR))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from manifest_schema import MANIFEST_SCHEMA, load_validator
+
+
+def load_script(filename):
+    """
+    Import a script whose file name is not a valid module name.
+
+    :param filename: File name inside .github/scripts
+    :return: Module
+    """
+    spec = importlib.util.spec_from_file_location(filename.replace('-', '_')[:-3], os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SubmissionManifestTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.TemporaryDirectory()
+        cls.iter_errors = staticmethod(load_validator(MANIFEST_SCHEMA, cache_dir=cls.cache_dir.name))
+        cls.submission = load_script('create-new-content-from-submission.py')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.cache_dir.cleanup()
+
+    def setUp(self):
+        # The scripts read categories.json relative to the repository root
+        self.cwd = os.getcwd()
+        os.chdir(REPO_ROOT)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def assertValid(self, manifest):
+        errors = [f"{'/'.join(map(str, error.path))}: {error.message}" for error in self.iter_errors(manifest)]
+        self.assertEqual(errors, [])
+
+    def form_data(self, **fields):
+        return {
+            'content-name': 'Slime',
+            'description': 'A friendly slime',
+            'author': 'username',
+            'image-url': 'https://example.com/slime.png',
+            'rating': 'SFW',
+            'perchance-url': 'https://perchance.org/ai-character-chat?data=Slime~abc123.gz',
+            **fields
+        }
+
+    def test_character_manifest(self):
+        self.assertValid(self.submission.create_manifest('Character', self.form_data(species=['Slime']), 'username'))
+
+    def test_manifest_without_rating_tags(self):
+        # The required rating category comes out as an empty list
+        manifest = self.submission.create_manifest('Character', self.form_data(gender=['Female']), 'username')
+        self.assertEqual(manifest['categories']['rating'], [])
+        self.assertValid(manifest)
+
+    def test_lorebook_manifest(self):
+        self.assertValid(self.submission.create_manifest('Lorebook', self.form_data(), 'username'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+# tracing.py
+# Level-gated logging, timing spans with Chrome trace export and opt-in profiling of one run
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+# Spans kept for the trace file, a long running worker drops the oldest
+MAX_TRACE_EVENTS = 200000
+# Allocation sites listed in the tracemalloc report
+PROFILE_TOP_ALLOCATIONS = 30
+
+# Names of the spans open in the current thread, innermost last
+_spans = contextvars.ContextVar('spans', default=())
+_trace_events = None
+_trace_lock = threading.Lock()
+_epoch = time.perf_counter()
+_profile_target = None
+_profile_dir = '.'
+_profile_lock = threading.Lock()
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Plain messages for INFO, "LEVEL: message" otherwise, like the scripts always printed.
+    """
+
+    def format(self, record):
+        message = record.getMessage()
+        if record.exc_info:
+            message = f"{message}\n{self.formatException(record.exc_info)}"
+        if record.levelno == logging.INFO:
+            return message
+        return f"{record.levelname}: {message}"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with the open spans and any `extra` fields.
+    """
+
+    # Attributes every LogRecord has, the rest came in through extra=
+    _RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName
+        }
+        spans = _spans.get()
+        if spans:
+            entry['span'] = '/'.join(spans)
+        for key, value in vars(record).items():
+            if key not in self._RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level=None, fmt=None):
+    """
+    Send all loggers to stdout.
+
+    :param level: Level name, defaults to LOG_LEVEL or INFO
+    :param fmt: 'text' or 'json', defaults to LOG_FORMAT or text
+    """
+    level = (level or os.environ.get('LOG_LEVEL') or 'INFO').upper()
+    fmt = (fmt or os.environ.get('LOG_FORMAT') or 'text').lower()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+def enable_tracing():
+    """
+    Start collecting spans for write_chrome_trace().
+    """
+    global _trace_events
+    with _trace_lock:
+        if _trace_events is None:
+            _trace_events = deque(maxlen=MAX_TRACE_EVENTS)
+
+
+@contextmanager
+def span(name, **args):
+    """
+    Time a block as a trace span, nested spans show up below it.
+
+    :param name: Span name, e.g. '_commit_files'
+    :param args: Values shown with the span in the trace viewer
+    """
+    token = _spans.set(_spans.get() + (name,))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        _spans.reset(token)
+        logger = logging.getLogger('tracing')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s took %.1f ms", name, 1000 * (ended - started))
+        if _trace_events is not None:
+            _trace_events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': round(1e6 * (started - _epoch), 1),
+                'dur': round(1e6 * (ended - started), 1),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args
+            })
+
+
+def traced(name):
+    """
+    Decorator timing every call of a function as a span.
+
+    :param name: Span name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_chrome_trace(path):
+    """
+    Write the collected spans in the Chrome trace event format (chrome://tracing, Perfetto).
+
+    :param path: Output path
+    :return: Number of spans written
+    """
+    with _trace_lock:
+        events = list(_trace_events or ())
+    # Name the rows of the viewer after the threads that are still known
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    metadata = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': thread_names[tid]}}
+        for tid in sorted({event['tid'] for event in events})
+        if tid in thread_names
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+
+def configure_profiling(target, directory='.'):
+    """
+    Profile the run of one key, e.g. an issue number, with cProfile and tracemalloc.
+
+    :param target: Key to profile, compared as a string
+    :param directory: Directory for the .pstats and memory report
+    """
+    global _profile_target, _profile_dir
+    _profile_target = str(target)
+    _profile_dir = directory
+
+
+@contextmanager
+def profile_if_selected(key):
+    """
+    Profile the block if its key was selected with configure_profiling().
+
+    Writes profile-<key>.pstats (open with `python -m pstats`) and
+    profile-<key>-memory.txt with the peak traced memory and the top
+    allocation sites. Only one run is profiled at a time, cProfile only
+    sees the thread that runs the block.
+
+    :param key: Key of the run, e.g. the issue number
+    """
+    if _profile_target is None or str(key) != _profile_target or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    import cProfile
+    import tracemalloc
+
+    logger = logging.getLogger('tracing')
+    os.makedirs(_profile_dir, exist_ok=True)
+    stats_path = os.path.join(_profile_dir, f'profile-{key}.pstats')
+    memory_path = os.path.join(_profile_dir, f'profile-{key}-memory.txt')
+    profiler = cProfile.Profile()
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(25)
+    tracemalloc.reset_peak()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+        profiler.dump_stats(stats_path)
+        with open(memory_path, 'w', encoding='utf-8') as f:
+            f.write(f"Peak traced memory: {peak / 1024:.1f} KiB, still allocated at the end: {current / 1024:.1f} KiB\n\n")
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+        logger.info("Profile of %s written to %s and %s", key, stats_path, memory_path)
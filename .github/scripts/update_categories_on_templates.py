@@ -5,6 +5,7 @@ import re
 import os
 from typing import Dict, List
 import sys
+from category_registry import get_registry
 
 class TemplateUpdater:
     """
@@ -24,8 +25,7 @@ class TemplateUpdater:
         """
         try:
             print("Loading categories.json...")
-            with open('categories.json', 'r') as f:
-                categories = json.load(f)
+            categories = get_registry().categories
             print(f"Successfully loaded {len(categories)} categories")
             return categories
         except FileNotFoundError: